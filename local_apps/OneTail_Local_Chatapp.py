@@ -54,6 +54,8 @@ class Style:
 
 # --- GLOBAL STATE & PROMPTS ---
 ENTRY_PLACEHOLDER = "Ask a question or type a command..."
+HISTORY_SUMMARY_SYSTEM_PROMPT = """You maintain the memory of a long conversation between a user and an AI assistant. Update the summary of the earlier conversation with the new messages.
+Keep the user's goals and preferences, facts, names, numbers, decisions and open questions. Write it as compact notes, not as a dialogue."""
 tts_queue = queue.Queue()
 def tts_worker():
     engine = pyttsx3.init()
@@ -72,6 +74,86 @@ def get_project_root():
 
 PROJECT_ROOT = get_project_root()
 
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return max(1, (len(text) + 3) // 4)
+
+class ChatHistoryManager:
+    """Keeps the history sent with each chat turn within a token budget.
+
+    Recent turns are sent verbatim; older ones are folded into a rolling
+    summary per session. The summary is updated in a background thread after
+    a turn, so a turn never waits for it: until it catches up, the oldest
+    unsummarized turns are left out instead.
+    """
+    def __init__(self, summarize):
+        self.summarize = summarize # (model, previous summary, messages, max_tokens) -> new summary
+        self.sessions = {} # session id -> {"summary", "folded": messages covered by the summary, "busy"}
+        self.lock = threading.Lock()
+
+    def _state(self, session_id):
+        return self.sessions.setdefault(session_id, {"summary": "", "folded": 0, "busy": False})
+
+    def build_messages(self, session_id, history, prompt, budget_tokens):
+        """Returns the summary, as many recent messages as fit in budget_tokens, and the new prompt."""
+        with self.lock:
+            state = dict(self._state(session_id))
+        used = estimate_tokens(prompt) + (estimate_tokens(state["summary"]) if state["summary"] else 0)
+        recent = []
+        for message in reversed(history[state["folded"]:]):
+            used += estimate_tokens(message["content"])
+            if used > budget_tokens: break
+            recent.insert(0, message)
+        while recent and recent[0]["role"] != "user":
+            recent.pop(0) # Start at a question, not in the middle of an exchange
+        messages = [{'role': 'system', 'content': f"Summary of the earlier conversation:\n{state['summary']}"}] if state["summary"] else []
+        return messages + recent + [{'role': 'user', 'content': prompt}]
+
+    def compact_in_background(self, session_id, history, model, budget_tokens):
+        """Folds older turns into the summary once the unsummarized ones fill three quarters of the budget.
+
+        The newest quarter of the budget stays verbatim, and the summary may take
+        another quarter, so the prompt prefix only changes every few turns.
+        """
+        with self.lock:
+            state = self._state(session_id)
+            folded = state["folded"]
+            if state["busy"] or sum(estimate_tokens(m["content"]) for m in history[folded:]) <= budget_tokens * 3 // 4:
+                return
+            cut, tail_tokens = len(history), 0
+            for i in range(len(history) - 1, folded - 1, -1):
+                tail_tokens += estimate_tokens(history[i]["content"])
+                if tail_tokens > budget_tokens // 4: break
+                if history[i]["role"] == "user": cut = i
+            if cut == len(history):
+                cut = max(folded, len(history) - 2) # The last exchange alone is over a quarter of the budget
+            if cut <= folded:
+                return
+            state["busy"] = True
+            previous_summary, messages = state["summary"], history[folded:cut]
+        threading.Thread(target=self._compact, args=(session_id, model, previous_summary, messages, folded, cut, budget_tokens // 4),
+                         daemon=True).start()
+
+    def _compact(self, session_id, model, previous_summary, messages, folded, cut, max_tokens):
+        try:
+            start_time = time.time()
+            summary = self.summarize(model, previous_summary, messages, max_tokens)
+            print(f"  [History] Folded {len(messages)} messages of '{session_id}' into its summary in {time.time() - start_time:.1f}s.")
+        except Exception as e:
+            summary = None
+            print(f"  [History] Could not update the summary of '{session_id}': {e}")
+        with self.lock:
+            state = self.sessions.get(session_id)
+            if state is None: return # The session was deleted meanwhile
+            state["busy"] = False
+            if summary and state["folded"] == folded:
+                state["summary"], state["folded"] = summary, cut
+
+    def forget(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+
 class ResearchApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -94,6 +176,7 @@ class ResearchApp(tk.Tk):
         self.is_muted = False
         self.last_tok_per_sec = ""
         self.chat_sessions = {}
+        self.history_manager = ChatHistoryManager(self._summarize_history)
         self.current_chat_id = None
         self.chat_counter = 0
 
@@ -275,7 +358,7 @@ class ResearchApp(tk.Tk):
         self.append_to_chat(f"You: {prompt}\n", "user_tag"); self.chat_box.see(tk.END)
         self.entry_box.config(state=tk.DISABLED); self.entry_box.delete(0, tk.END); self.add_placeholder()
 
-        threading.Thread(target=self.normal_chat_thread, args=(prompt, self.chat_sessions[self.current_chat_id]), daemon=True).start()
+        threading.Thread(target=self.normal_chat_thread, args=(prompt, self.current_chat_id), daemon=True).start()
 
     def stream_response_to_chat(self, response_stream):
         print("Streaming response to chat window...")
@@ -322,20 +405,38 @@ class ResearchApp(tk.Tk):
         print("Finished streaming response.")
         self.after(0, self.finalize_response)
 
-    def normal_chat_thread(self, prompt, message_history):
+    def normal_chat_thread(self, prompt, chat_id):
         try:
             print("Executing normal chat thread...")
-            self.after(0, lambda: self.append_to_chat(f"{self.model_var.get().split(':')[0].capitalize()} (Chat): ", "bot_name_tag"))
+            model = self.model_var.get()
+            self.after(0, lambda: self.append_to_chat(f"{model.split(':')[0].capitalize()} (Chat): ", "bot_name_tag"))
             
-            print(f"Sending chat request to model '{self.model_var.get()}'...")
-            response = self.ollama_client.chat(model=self.model_var.get(), messages=message_history + [{'role': 'user', 'content': prompt}], stream=True)
-            self.stream_response_to_chat(response)
+            message_history, budget = self.chat_sessions[chat_id], self._history_budget(model)
+            messages = self.history_manager.build_messages(chat_id, message_history, prompt, budget)
             message_history.append({'role': 'user', 'content': prompt})
+            print(f"Sending chat request to model '{model}' ({len(messages) - 1} of {len(message_history) - 1} earlier messages)...")
+            response = self.ollama_client.chat(model=model, messages=messages, stream=True)
+            self.stream_response_to_chat(response)
+            self.history_manager.compact_in_background(chat_id, message_history, model, budget)
         except Exception as e:
             self.after(0, self.append_to_chat, f"\nError in chat thread: {e}\n\n", "error_tag")
         finally:
             self.after(0, lambda: self.entry_box.config(state=tk.NORMAL))
 
+    def _history_budget(self, model):
+        """Tokens of earlier conversation sent with a chat turn: history_token_budget, per model or as one number."""
+        budget = self.app_config.get("history_token_budget", 2048)
+        if isinstance(budget, dict):
+            budget = budget.get(model, budget.get(model.split(':')[0], budget.get("default", 2048)))
+        return int(budget)
+
+    def _summarize_history(self, model, previous_summary, messages, max_tokens):
+        transcript = "\n\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in messages)
+        prompt = f"Summary so far:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+        messages = [{'role': 'system', 'content': HISTORY_SUMMARY_SYSTEM_PROMPT}, {'role': 'user', 'content': prompt}]
+        response = self.ollama_client.chat(model=model, messages=messages, options={"num_predict": max_tokens})
+        return response['message']['content'].strip()
+
     def populate_models(self):
         print("Populating available models...")
         try:
@@ -370,6 +471,7 @@ class ResearchApp(tk.Tk):
         chat_to_remove = self.chat_list_box.get(selected_indices[0])
         if messagebox.askyesno("Confirm Removal", f"Delete chat '{chat_to_remove}'?"):
             del self.chat_sessions[chat_to_remove]
+            self.history_manager.forget(chat_to_remove)
             self.chat_list_box.delete(selected_indices[0])
             if self.current_chat_id == chat_to_remove: self.start_new_chat()
 
@@ -524,7 +626,9 @@ class ResearchApp(tk.Tk):
             "ollama_path": os.path.join("Portable_AI_Assets", "ollama_main", "ollama.exe"),
             "model_folder": os.path.join("Portable_AI_Assets", "models"),
             "vector_cache_dir": os.path.join("Portable_AI_Assets", "vector_cache"),
-            "embedding_model_name": "mxbai-embed-large"
+            "embedding_model_name": "mxbai-embed-large",
+            # Tokens of earlier conversation sent with each turn, per chat model ("default" for the rest).
+            "history_token_budget": {"default": 2048}
         }
         
         config_from_file = {}
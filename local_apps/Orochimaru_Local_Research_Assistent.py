@@ -12,9 +12,17 @@ import datetime
 import json
 import signal
 import shutil
+import hashlib
+import socket
+import sqlite3
+import zlib
+from collections import OrderedDict, deque
+from array import array
+from itertools import accumulate
 import httpx
+import httpcore
 from multiprocessing import Pool, cpu_count
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, wait
 
 # --- PROJECT ROOT ---
 # Get project root for both dev and bundled (PyInstaller) environments
@@ -89,6 +97,7 @@ class Style:
     ICON_MUTE = "🔇"
     ICON_NEW_CHAT = "➕"
     ICON_DELETE = "➖"
+    ICON_STOP = "■"
 
 # --- GLOBAL STATE & PROMPTS ---
 ENTRY_PLACEHOLDER = "Ask a question or type a command..."
@@ -98,10 +107,35 @@ Strictly adhere to the following rules:
 1.  **Answer only from the provided context.** Do not use any outside knowledge.
 2.  If the answer is not explicitly present in the provided context, state clearly and concisely: "I cannot find the answer to your question in the provided document." Do NOT attempt to guess or infer.
 3.  Do not make up any information.
-4.  If applicable, cite the page number(s) from which you extracted the information. The page numbers are provided in the context as '[Page X]:'.
+4.  If applicable, cite the page number(s) from which you extracted the information. The page numbers are provided in the context as '[Page X]:', or '[Pages X, Y]:' when the same text appears on several pages.
+"""
+CORPUS_RAG_SYSTEM_PROMPT = """You are an accurate and helpful AI assistant specializing in document analysis.
+Your primary goal is to answer the user's question SOLELY based on the provided context, which contains excerpts from several documents.
+Strictly adhere to the following rules:
+1.  **Answer only from the provided context.** Do not use any outside knowledge.
+2.  If the answer is not explicitly present in the provided context, state clearly and concisely: "I cannot find the answer to your question in the loaded documents." Do NOT attempt to guess or infer.
+3.  Do not make up any information.
+4.  Cite the document and page number(s) for every piece of information. They are provided in the context as '[Document, Page X]:', or '[Document, Pages X, Y]:' when the same text appears on several pages.
 """
 SUMMARIZE_SYSTEM_PROMPT = "You are a helpful AI assistant. Your user wants you to summarize a research paper. Provide a concise summary of the document provided."
 REVIEW_SYSTEM_PROMPT = "You are a helpful AI assistant with expertise in research papers. Your user wants you to provide a peer review of a research paper. Provide a critical review of the document, focusing on its strengths and weaknesses."
+SECTION_NOTES_SYSTEM_PROMPT = """You are reading one section of a longer research paper. Write dense notes on this section only, for a colleague who will later summarize or review the whole paper from your notes.
+Record the section's aims, methods, materials and samples, key results with their numbers and units, equations, claims, and any stated limitations. Keep page references as '[Page X]'. Do not add anything that is not in the section."""
+MERGE_NOTES_SYSTEM_PROMPT = """You are given consecutive sets of notes taken on a research paper. Merge them into one set of notes in the same order.
+Keep every key result with its numbers and units, every method and claim, and the '[Page X]' references. Drop repetition only."""
+
+def build_rag_messages(system_prompt, preamble, context, question):
+    """Lays out a document question so that everything before the retrieved context is identical on every turn.
+
+    Ollama reuses its prompt cache for the longest prefix shared with the
+    previous request, so the system prompt and the document preamble come
+    first and never change, and the per-question context goes last.
+    """
+    return [{'role': 'system', 'content': f"{system_prompt}\n{preamble}"},
+            {'role': 'user', 'content': f"--- CONTEXT ---\n{context}\n--- END CONTEXT ---\n\nQuestion: {question}"}]
+
+HISTORY_SUMMARY_SYSTEM_PROMPT = """You maintain the memory of a long conversation between a user and an AI assistant. Update the summary of the earlier conversation with the new messages.
+Keep the user's goals and preferences, facts, names, numbers, decisions and open questions. Write it as compact notes, not as a dialogue."""
 tts_queue = queue.Queue()
 ALL_REVIEWERS = {
     "Physicist": "You are a reviewer with expertise in Physics. Focus on the underlying physical principles, theoretical models, and the validity of any physical measurements presented.",
@@ -120,28 +154,1588 @@ def tts_worker():
             engine.runAndWait()
         tts_queue.task_done()
 
-def parse_pages_worker(args):
-    """Worker function to extract text from a range of PDF pages."""
+# --- DOCUMENT INDEX ---
+# Chunking parameters are part of the index key (see Chunker.signature), so changing
+# them invalidates previously persisted indexes instead of silently reusing them.
+CHUNK_SIZE = 500          # Legacy fixed chunker: characters per chunk
+CHUNK_STRIDE = 400        # Legacy fixed chunker: characters between chunk starts
+CHUNK_TOKENS = 200        # Structured chunker: approximate token budget per chunk
+CHUNK_OVERLAP_TOKENS = 30 # Structured chunker: tokens repeated from the previous chunk
+PARSE_TASK_PAGES = 1     # Pages per parse task handed to a worker
+PARSE_WINDOW_PER_WORKER = 4 # Parse tasks running or awaiting reordering, per worker
+PAGE_UNIT_SEARCH_ROWS = 4 # Chunks searched ahead for each text unit when a page table is saved
+WRITE_QUEUE_BATCHES = 4  # Embedded batches that may wait for the vector writer
+EMBED_MAX_ATTEMPTS = 3   # Tries per embedding batch before the ingest fails
+CHECKPOINT_INTERVAL = 5.0 # Seconds between ingest checkpoints
+PARSE_POLL_INTERVAL = 0.5 # Seconds the ingest loop waits for parsed pages before checking for a cancel
+ANN_TRAIN_SAMPLE = 65536 # Rows sampled to train the IVF centroids
+ANN_RETRAIN_GROWTH = 8   # Retrain once the corpus is this many times larger than the training corpus
+SCORE_BLOCK_ROWS = 16384 # Vector rows converted to float32 and scored at a time during search
+PQ_SUBVECTOR_DIMS = 4    # Dimensions per product-quantization code byte
+PQ_TRAIN_SAMPLE = 8192   # Rows sampled to train the product-quantization codebooks
+PQ_MIN_ROWS = 4096       # Smaller documents use int8 instead: the PQ codebooks would outweigh the savings
+RERANK_FACTOR = 8        # Candidates per result re-scored exactly when searching quantized vectors
+BM25_K1 = 1.2            # BM25 term-frequency saturation
+BM25_B = 0.75            # BM25 chunk-length normalization
+RRF_K = 60               # Reciprocal rank fusion damping: a result at rank r contributes 1 / (RRF_K + r)
+HYBRID_CANDIDATES = 4    # Candidates per requested chunk taken from each retriever before fusion
+INDEX_FORMAT_VERSION = 2
+
+# --- SUMMARIES AND REVIEWS ---
+# Documents longer than the context budget are read section by section ("map"),
+# and the section notes are merged until they fit in one final request ("reduce").
+SUMMARY_NOTES_TOKENS = 400   # Output cap of each section's notes
+SUMMARY_ANSWER_TOKENS = 1024 # Context kept free for the final summary or review
+SUMMARY_PROMPT_TOKENS = 512  # Context kept for instructions, plus slack for the rough token estimate
+
+def compute_file_hash(file_path, block_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9(\[])')
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return max(1, (len(text) + 3) // 4)
+
+class ChunkPacker:
+    """Packs text units into chunks of at most max_tokens, in document order.
+
+    Units carry over between add() calls, so chunks may span page batches. A
+    chunk is closed early at a paragraph boundary once it is 75% full, and the
+    next chunk starts with up to overlap_tokens of trailing units. The overlap
+    counts against max_tokens: its oldest units are dropped when the next unit
+    would not fit otherwise.
+    """
+    def __init__(self, max_tokens, overlap_tokens):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.current, self.current_tokens, self.has_new_units = [], 0, False
+
+    def add(self, units):
+        chunks = []
+        for unit in units:
+            if self.current_tokens + unit["tokens"] > self.max_tokens:
+                if self.has_new_units:
+                    chunks.append(self._close_chunk())
+                while self.current and self.current_tokens + unit["tokens"] > self.max_tokens:
+                    self.current_tokens -= self.current.pop(0)["tokens"] # Trim the carried-over overlap
+            self.current.append(unit)
+            self.current_tokens += unit["tokens"]
+            self.has_new_units = True
+            if unit["block_end"] and self.current_tokens >= self.max_tokens * 0.75:
+                chunks.append(self._close_chunk())
+        return chunks
+
+    def finish(self):
+        return [self._close_chunk()] if self.has_new_units else []
+
+    def _close_chunk(self):
+        text = "".join(u["text"] + ("\n" if u["block_end"] else " ") for u in self.current).strip()
+        chunk = {"text": text, "page": self.current[0]["page"]}
+
+        # Carry the trailing units that fit in the overlap budget into the next chunk.
+        tail, tail_tokens = [], 0
+        for unit in reversed(self.current):
+            if tail_tokens + unit["tokens"] > self.overlap_tokens: break
+            tail.insert(0, unit); tail_tokens += unit["tokens"]
+        self.current, self.current_tokens, self.has_new_units = tail, tail_tokens, False
+        return chunk
+
+class FixedSizeChunker:
+    """Legacy chunker: fixed character windows that never cross a page."""
+    name = "fixed"
+
+    def __init__(self, size=CHUNK_SIZE, stride=CHUNK_STRIDE):
+        self.size, self.stride = size, stride
+
+    def signature(self):
+        return f"fixed:{self.size}/{self.stride}"
+
+    def split_page(self, page, page_num):
+        text = page.get_text("text")
+        # Every window is a full chunk on its own: one token, always closing the chunk.
+        return [{"text": text[i:i+self.size], "page": page_num + 1, "tokens": 1, "block_end": True}
+                for i in range(0, len(text), self.stride)] if text else []
+
+    def packer(self):
+        return ChunkPacker(max_tokens=1, overlap_tokens=0)
+
+class StructuredChunker:
+    """Splits pages along PyMuPDF text blocks and sentences, then packs them to a token budget.
+
+    Chunks can span pages, prefer to end at paragraph boundaries, and overlap by
+    whole sentences rather than by a fixed number of characters.
+    """
+    name = "structured"
+
+    def __init__(self, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+        self.max_tokens, self.overlap_tokens = max_tokens, overlap_tokens
+
+    def signature(self):
+        return f"structured:{self.max_tokens}/{self.overlap_tokens}"
+
+    def split_page(self, page, page_num):
+        units = []
+        for block in page.get_text("blocks", sort=True):
+            if block[6] != 0: continue # Skip image blocks
+            # Re-join words hyphenated across lines, then flatten the block to one line.
+            text = re.sub(r"-\n(?=[a-z])", "", block[4])
+            text = re.sub(r"\s+", " ", text).strip()
+            if not text: continue
+
+            sentences = []
+            for sentence in SENTENCE_BOUNDARY_RE.split(text):
+                sentences.extend(self._split_long_sentence(sentence))
+            for i, sentence in enumerate(sentences):
+                units.append({"text": sentence, "page": page_num + 1, "tokens": estimate_tokens(sentence),
+                              "block_end": i == len(sentences) - 1})
+        return units
+
+    def _split_long_sentence(self, sentence):
+        if estimate_tokens(sentence) <= self.max_tokens:
+            return [sentence]
+        pieces, words, piece = [], sentence.split(" "), []
+        for word in words:
+            if piece and estimate_tokens(" ".join(piece + [word])) > self.max_tokens:
+                pieces.append(" ".join(piece)); piece = []
+            piece.append(word)
+        if piece: pieces.append(" ".join(piece))
+        return pieces
+
+    def packer(self):
+        return ChunkPacker(self.max_tokens, self.overlap_tokens)
+
+PAGE_NUMBER_RE = re.compile(r'^\s*(page\s*)?[-\u2013(\[]?\s*\d{1,4}\s*[-\u2013)\]]?(\s*(of|/)\s*\d{1,4})?\s*$', re.IGNORECASE)
+
+class BoilerplateFilter:
+    """Drops running headers, footers and page numbers from parsed text units.
+
+    Only short units near the top or bottom of a page are candidates. A candidate
+    is boilerplate once the same line (with digits masked, so "Page 3" matches
+    "Page 4") shows up on min_pages different pages. Pages are held back for a
+    few pages of lookahead, so the first pages of a document are cleaned too.
+    """
+    EDGE_UNITS = 3
+    MAX_LINE_CHARS = 150
+
+    def __init__(self, lookahead_pages=8, min_pages=3):
+        self.lookahead_pages, self.min_pages = lookahead_pages, min_pages
+        self.line_page_counts = {}
+        self.held_pages = deque() # (page number, units, candidate keys)
+        self.dropped_units, self.dropped_chars = 0, 0
+
+    @staticmethod
+    def _line_key(text):
+        return re.sub(r"\d+", "#", re.sub(r"\s+", " ", text.strip().lower()))
+
+    def add(self, units):
+        """Takes units in page order and returns the cleaned units of pages that left the lookahead window."""
+        released = []
+        for unit in units:
+            if not self.held_pages or self.held_pages[-1][0] != unit["page"]:
+                if self.held_pages: self._count_page(self.held_pages[-1])
+                self.held_pages.append((unit["page"], [], {}))
+                if len(self.held_pages) > self.lookahead_pages + 1:
+                    released.extend(self._release_page())
+            self.held_pages[-1][1].append(unit)
+        return released
+
+    def finish(self):
+        released = []
+        if self.held_pages: self._count_page(self.held_pages[-1])
+        while self.held_pages:
+            released.extend(self._release_page())
+        return released
+
+    def _count_page(self, held_page):
+        _, units, keys = held_page
+        edge_indices = set(range(min(self.EDGE_UNITS, len(units)))) | set(range(max(0, len(units) - self.EDGE_UNITS), len(units)))
+        for i in edge_indices:
+            if len(units[i]["text"]) <= self.MAX_LINE_CHARS:
+                keys[i] = self._line_key(units[i]["text"])
+        for key in set(keys.values()):
+            self.line_page_counts[key] = self.line_page_counts.get(key, 0) + 1
+
+    def _release_page(self):
+        _, units, keys = self.held_pages.popleft()
+        kept = []
+        for i, unit in enumerate(units):
+            key = keys.get(i)
+            if key is not None and (self.line_page_counts.get(key, 0) >= self.min_pages or PAGE_NUMBER_RE.match(unit["text"])):
+                self.dropped_units += 1
+                self.dropped_chars += len(unit["text"])
+                # The unit before a dropped block-ending unit now ends its paragraph.
+                if unit["block_end"] and kept: kept[-1] = dict(kept[-1], block_end=True)
+                continue
+            kept.append(unit)
+        return kept
+
+class ChunkDeduplicator:
+    """Embeds identical chunks once. Later copies are recorded in `also_pages` under the first chunk's row.
+
+    Unique chunks become rows in the order filter() returns them, so passing a
+    ChunkTable's also_pages dict attaches the extra pages to the right rows even
+    before those rows have been written.
+    """
+    def __init__(self, also_pages):
+        self.also_pages = also_pages
+        self.first_by_digest = {} # digest -> (row, page)
+        self.rows = 0
+        self.duplicates, self.duplicate_chars = 0, 0
+
+    def filter(self, chunks):
+        unique = []
+        for chunk in chunks:
+            digest = hashlib.sha1(re.sub(r"\s+", " ", chunk["text"]).strip().lower().encode("utf-8")).digest()
+            first = self.first_by_digest.get(digest)
+            if first is None:
+                self.first_by_digest[digest] = (self.rows, chunk["page"])
+                self.rows += 1
+                unique.append(chunk)
+                continue
+            self.duplicates += 1
+            self.duplicate_chars += len(chunk["text"])
+            first_row, first_page = first
+            if chunk["page"] != first_page and chunk["page"] not in self.also_pages.get(first_row, []):
+                self.also_pages.setdefault(first_row, []).append(chunk["page"])
+        return unique
+
+def format_pages(chunk):
+    """Returns "Page 3", or "Pages 3, 9" for a chunk whose duplicates on other pages were merged into it."""
+    pages = [chunk["page"]] + chunk.get("also_pages", [])
+    return f"Page {pages[0]}" if len(pages) == 1 else "Pages " + ", ".join(map(str, pages))
+
+class ChunkTable:
+    """A document's chunks, stored column-wise: one UTF-8 buffer plus offset and page arrays.
+
+    Row i describes vector row i. Indexing and iteration build the familiar
+    {"text", "page"} dict on demand, so a large document costs a few bytes of
+    bookkeeping per chunk instead of several Python objects. The vector writer
+    thread appends rows while chat threads read the rows written so far, so
+    the row count is only advanced after the arrays hold the new rows.
+    """
+    def __init__(self):
+        self.text = bytearray()
+        self.ends = array('Q') # End offset of each row's text in the buffer
+        self.pages = array('I')
+        self.also_pages = {} # row -> other pages with the same text (sparse)
+        self.count = 0
+
+    @classmethod
+    def from_records(cls, chunks):
+        table = cls()
+        table.extend(chunks)
+        return table
+
+    def extend(self, chunks):
+        first_row = len(self.ends)
+        for row, chunk in enumerate(chunks, first_row):
+            self.text += chunk["text"].encode("utf-8")
+            self.ends.append(len(self.text))
+            self.pages.append(chunk["page"])
+            if chunk.get("also_pages"):
+                self.also_pages[row] = chunk["also_pages"]
+        self.count = len(self.ends)
+
+    def __len__(self):
+        return self.count
+
+    def text_at(self, i):
+        start = self.ends[i - 1] if i else 0
+        return self.text[start:self.ends[i]].decode("utf-8")
+
+    def __getitem__(self, i):
+        i = int(i)
+        if i < 0: i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("chunk index out of range")
+        chunk = {"text": self.text_at(i), "page": self.pages[i]}
+        if i in self.also_pages:
+            chunk["also_pages"] = self.also_pages[i]
+        return chunk
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def to_records(self):
+        """Returns the rows as a list of dicts, the format of the persisted chunk table."""
+        return list(self)
+
+CHUNKERS = {FixedSizeChunker.name: FixedSizeChunker, StructuredChunker.name: StructuredChunker}
+
+def make_chunker(app_config):
+    """Builds the chunker selected in the config, falling back to the structured one."""
+    chunker_name = app_config.get("chunker", StructuredChunker.name)
+    if chunker_name == FixedSizeChunker.name:
+        return FixedSizeChunker()
+    if chunker_name not in CHUNKERS:
+        print(f"Warning: Unknown chunker '{chunker_name}'. Using '{StructuredChunker.name}'.")
+    return StructuredChunker(int(app_config.get("chunk_tokens", CHUNK_TOKENS)),
+                             int(app_config.get("chunk_overlap_tokens", CHUNK_OVERLAP_TOKENS)))
+
+# Documents kept open by a parse worker process while their ingest runs: path -> (file stamp, fitz.Document).
+_worker_documents = {}
+WORKER_OPEN_DOCUMENTS = 4
+
+def init_parse_worker():
+    """Initializer for the long-lived parse pool: pays the PyMuPDF import once per worker."""
+    global fitz
     import fitz
-    
-    pdf_path, page_numbers = args
-    page_chunks = []
+
+def _close_worker_document(pdf_path):
+    cached = _worker_documents.pop(pdf_path, None)
+    if cached is not None:
+        cached[1].close()
+
+def _open_worker_document(pdf_path, keep_open=()):
+    """Returns an open document for this worker, reopening it if the file changed on disk.
+
+    Documents whose ingest has ended (not in `keep_open`) are closed first, so a
+    worker holds a finished PDF open (and locked, on Windows) at most until its
+    next task.
+    """
+    for stale_path in [path for path in _worker_documents if path != pdf_path and path not in keep_open]:
+        _close_worker_document(stale_path)
+    stat = os.stat(pdf_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _worker_documents.get(pdf_path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+    elif len(_worker_documents) >= WORKER_OPEN_DOCUMENTS:
+        # Close the document opened longest ago (dicts keep insertion order).
+        oldest_path = next(iter(_worker_documents))
+        _worker_documents.pop(oldest_path)[1].close()
+    doc = fitz.open(pdf_path)
+    _worker_documents.pop(pdf_path, None)
+    _worker_documents[pdf_path] = (stamp, doc)
+    return doc
+
+class TextUnitBatch:
+    """Text units of one parse task, packed for the trip from a worker process to the app.
+
+    Pickling one UTF-8 buffer and a few arrays is far cheaper than pickling a
+    dict per sentence. Iterating the batch in the app rebuilds the unit dicts
+    one at a time as the chunking pipeline consumes them.
+    """
+    def __init__(self, units):
+        texts = [unit["text"] for unit in units]
+        self.text = "".join(texts).encode("utf-8")
+        self.ends = array('I', accumulate(len(text) for text in texts)) # Character offsets
+        self.pages = array('I', (unit["page"] for unit in units))
+        self.tokens = array('I', (unit["tokens"] for unit in units))
+        self.block_ends = bytes(unit["block_end"] for unit in units)
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __iter__(self):
+        text, start = self.text.decode("utf-8"), 0
+        for i, end in enumerate(self.ends):
+            yield {"text": text[start:end], "page": self.pages[i], "tokens": self.tokens[i], "block_end": bool(self.block_ends[i])}
+            start = end
+
+def parse_pages_worker(args, keep_open=(), is_last=False):
+    """Worker function to extract text units from a range of PDF pages, returned as a TextUnitBatch.
+
+    `keep_open` lists the documents still being ingested; `is_last` marks the
+    document's final task, after which this worker closes it.
+    """
+    pdf_path, page_numbers, chunker = args
+    page_units = []
     try:
-        # Open the document once per worker process
-        doc = fitz.open(pdf_path)
+        # The document stays open in this worker for the next batch of pages.
+        doc = _open_worker_document(pdf_path, keep_open)
         for page_num in page_numbers:
             page = doc.load_page(page_num)
-            text = page.get_text("text")
-            if text:
-                # Create chunks from the page text
-                for i in range(0, len(text), 400):
-                    page_chunks.append({"text": text[i:i+500], "page": page_num + 1})
-        doc.close()
-        return page_chunks
+            page_units.extend(chunker.split_page(page, page_num))
+        return TextUnitBatch(page_units)
     except Exception as e:
         # DO NOT print from a child process. Return the exception to the parent.
         return e
+    finally:
+        if is_last: _close_worker_document(pdf_path)
 
+def compute_page_fingerprints(pdf_path):
+    """Hashes each page's content stream and form XObjects, which change whenever the page's text does.
+
+    This reads the raw page description without extracting any text, so it is
+    cheap enough to run on every page when a document is reloaded.
+    """
+    fingerprints = []
+    doc = fitz.open(pdf_path)
+    try:
+        for page in doc:
+            digest = hashlib.sha1(page.read_contents())
+            # Pages that only draw a shared form (e.g. "/Fm0 Do") differ in the form's stream.
+            for xobject in page.get_xobjects():
+                digest.update(doc.xref_stream(xobject[0]) or b"")
+            digest.update(f"{tuple(page.rect)}|{page.rotation}".encode("utf-8"))
+            fingerprints.append(digest.hexdigest()[:20])
+    finally:
+        doc.close()
+    return fingerprints
+
+
+class PageParseScheduler:
+    """Hands page tasks to the parse pool and returns their text units in page order.
+
+    Workers pick up the next task as soon as they are free, so an image- or
+    table-heavy page only holds up the pages queued behind it instead of a whole
+    worker's share of the document. Results arrive in completion order and are
+    held in a reorder buffer until every earlier page is in. At most `window`
+    tasks are running or buffered at once, which keeps parsed text bounded.
+    Tasks with an entry in known_results are not sent to the pool; their units
+    are released in order as if a worker had returned them. `keep_open` returns
+    the paths of the documents still being ingested, which workers keep open.
+    """
+    def __init__(self, pool, tasks, window, known_results=None, keep_open=tuple):
+        self.pool, self.tasks, self.window = pool, tasks, max(1, window)
+        self.known_results = known_results or {}
+        self.keep_open = keep_open
+        self.last_pool_task = max((i for i in range(len(tasks)) if i not in self.known_results), default=-1)
+        self.results = queue.Queue()
+        self.reorder_buffer = {}
+        self.next_submit, self.next_release, self.pages_done = 0, 0, 0
+        self._submit_tasks()
+
+    @property
+    def done(self):
+        return self.next_release == len(self.tasks)
+
+    def _submit_tasks(self):
+        while self.next_submit < len(self.tasks) and self.next_submit - self.next_release < self.window:
+            i = self.next_submit
+            if i in self.known_results:
+                self.results.put((i, self.known_results.pop(i)))
+                self.next_submit += 1
+                continue
+            self.pool.apply_async(parse_pages_worker, (self.tasks[i], self.keep_open(), i == self.last_pool_task),
+                                  callback=lambda result, i=i: self.results.put((i, result)),
+                                  error_callback=lambda error, i=i: self.results.put((i, error)))
+            self.next_submit += 1
+
+    def get(self, timeout=None):
+        """Waits for the next finished task and returns the units that are now ready in page order (possibly none).
+
+        Returns None if no task finished within `timeout` seconds.
+        """
+        try:
+            i, result = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if isinstance(result, Exception):
+            pages = self.tasks[i][1]
+            raise ValueError(f"Parsing pages {pages[0] + 1}-{pages[-1] + 1} failed in worker. Error: {result}")
+        self.pages_done += len(self.tasks[i][1])
+        self.reorder_buffer[i] = result
+
+        ready_units = []
+        while self.next_release in self.reorder_buffer:
+            ready_units.extend(self.reorder_buffer.pop(self.next_release))
+            self.next_release += 1
+        self._submit_tasks()
+        return ready_units
+
+
+class EmbeddingBatchTuner:
+    """Chooses how many chunks to send per embedding request.
+
+    A fixed batch size is used as-is. With batch size 0 (auto), the size doubles
+    while throughput keeps improving and settles on the best size seen.
+    """
+    MIN_BATCH, START_BATCH, MAX_BATCH = 1, 16, 256
+
+    def __init__(self, configured_size=0):
+        self.auto = not configured_size or configured_size <= 0
+        self.batch_size = self.START_BATCH if self.auto else int(configured_size)
+        self.best_size, self.best_rate = self.batch_size, 0.0
+        self.settled = not self.auto
+
+    def describe(self):
+        return f"auto batch size, starting at {self.batch_size}" if self.auto else f"batch size {self.batch_size}"
+
+    def on_success(self, count, elapsed):
+        if self.settled or count < self.batch_size:
+            return
+        rate = count / max(elapsed, 1e-6)
+        if rate > self.best_rate * 1.05:
+            self.best_size, self.best_rate = self.batch_size, rate
+            if self.batch_size < self.MAX_BATCH:
+                self.batch_size = min(self.batch_size * 2, self.MAX_BATCH)
+                return
+        # Throughput stopped improving: go back to the best size and keep it.
+        self.batch_size, self.settled = self.best_size, True
+        print(f"  - Embedding batch size settled at {self.batch_size} ({self.best_rate:.1f} chunks/sec).")
+
+    def on_error(self):
+        """Halves the batch size after a failed request. Returns False if it cannot shrink any further."""
+        if self.batch_size <= self.MIN_BATCH:
+            return False
+        self.batch_size = max(self.batch_size // 2, self.MIN_BATCH)
+        self.best_size = min(self.best_size, self.batch_size)
+        self.settled = True
+        return True
+
+
+class AdaptiveConcurrencyController:
+    """Limits in-flight embedding requests using AIMD (additive increase, multiplicative decrease).
+
+    The limit grows by one after a full window of fast responses and is halved on
+    errors, timeouts, or when per-chunk latency rises well above the best seen,
+    which means the server has started queueing requests. The limit is shared by
+    every document being ingested: callers reserve a slot with try_acquire() and
+    free it with release() when the request finishes.
+    """
+    LATENCY_TOLERANCE = 2.0
+    THROUGHPUT_WINDOW = 10.0 # seconds
+
+    def __init__(self, max_limit, initial_limit=1):
+        self.max_limit = max(1, int(max_limit))
+        self.limit = max(1, min(initial_limit, self.max_limit))
+        self.baseline_latency = None # Best per-chunk latency seen
+        self.successes = 0
+        self.completions = deque() # (timestamp, chunk count)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.capacity_changed = threading.Condition(self.lock)
+
+    def has_capacity(self):
+        with self.lock:
+            return self.in_flight < self.limit
+
+    def try_acquire(self):
+        with self.lock:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self):
+        """Reserves a slot even when the limit is reached. Used for retries of a batch already counted once."""
+        with self.lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.capacity_changed.notify_all()
+
+    def wait_for_capacity(self, timeout):
+        with self.lock:
+            if self.in_flight >= self.limit:
+                self.capacity_changed.wait(timeout)
+
+    def on_success(self, count, elapsed):
+        with self.lock:
+            now = time.time()
+            self.completions.append((now, count))
+            while self.completions and now - self.completions[0][0] > self.THROUGHPUT_WINDOW:
+                self.completions.popleft()
+
+            per_chunk = elapsed / max(count, 1)
+            if self.baseline_latency is None or per_chunk < self.baseline_latency:
+                self.baseline_latency = per_chunk
+            if per_chunk > self.baseline_latency * self.LATENCY_TOLERANCE and self.limit > 1:
+                self._decrease(f"latency {per_chunk * 1000:.0f} ms/chunk")
+                return
+
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self.successes = 0
+                self.capacity_changed.notify_all()
+
+    def on_error(self, is_timeout=False):
+        with self.lock:
+            self._decrease("timeout" if is_timeout else "error")
+
+    def _decrease(self, reason):
+        new_limit = max(1, self.limit // 2)
+        if new_limit != self.limit:
+            print(f"  - Embedding concurrency {self.limit} -> {new_limit} ({reason}).")
+        self.limit, self.successes = new_limit, 0
+
+    def throughput(self):
+        with self.lock:
+            if len(self.completions) < 2:
+                return 0.0
+            span = self.completions[-1][0] - self.completions[0][0]
+            return sum(count for _, count in list(self.completions)[1:]) / max(span, 1e-6)
+
+    def describe(self):
+        return f"Concurrency: {self.limit} | {self.throughput():.1f} chunks/s"
+
+
+class EmbeddingCache:
+    """Disk-backed cache of embeddings keyed by (model, kind, SHA-256 of the text).
+
+    Stored in a SQLite file, so it survives restarts and is shared by every
+    document and by chat queries. `kind` keeps vectors that are stored
+    differently apart: "chunk" rows are normalized, "query" rows are kept as the
+    server returned them. When the stored vectors exceed max_bytes, the least
+    recently used entries are evicted. With max_bytes 0, or after close(), the
+    cache is a no-op.
+    """
+    def __init__(self, db_path, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits, self.misses, self.bytes_saved = 0, 0, 0
+        self.lock = threading.Lock()
+        self.conn = None
+        if max_bytes <= 0:
+            return
+        try:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(embeddings)")]
+            if columns and "kind" not in columns:
+                # Older caches mixed query and chunk vectors under one key, so they cannot be told apart.
+                print("Embedding cache: clearing entries written by an older version.")
+                self.conn.execute("DROP TABLE embeddings")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, kind TEXT NOT NULL, digest BLOB NOT NULL, "
+                              "vector BLOB NOT NULL, nbytes INTEGER NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (model, kind, digest))")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+            print(f"Embedding cache: {db_path} ({self.total_bytes / 1024 / 1024:.1f} MB used)")
+        except sqlite3.Error as e:
+            print(f"Warning: Embedding cache disabled. Could not open '{db_path}': {e}")
+            self.conn = None
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, model, texts, kind="chunk"):
+        """Returns a list with a float32 vector for each cached text and None for each miss."""
+        if self.conn is None:
+            return [None] * len(texts)
+        digests = [self._digest(text) for text in texts]
+        with self.lock:
+            if self.conn is None: # Closed while waiting for the lock
+                return [None] * len(texts)
+            placeholders = ",".join("?" * len(digests))
+            rows = dict(self.conn.execute(f"SELECT digest, vector FROM embeddings WHERE model = ? AND kind = ? AND digest IN ({placeholders})",
+                                          [model, kind, *digests]).fetchall())
+            if rows:
+                self.conn.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND kind = ? AND digest = ?",
+                                      [(time.time(), model, kind, digest) for digest in rows])
+                self.conn.commit()
+            self.hits += len(rows)
+            self.misses += len(digests) - len(rows)
+            self.bytes_saved += sum(len(vector) for vector in rows.values())
+        return [np.frombuffer(rows[d], dtype=np.float32) if d in rows else None for d in digests]
+
+    def put_many(self, model, texts, vectors, kind="chunk"):
+        if self.conn is None:
+            return
+        entries = {self._digest(text): np.asarray(vector, dtype=np.float32).tobytes() for text, vector in zip(texts, vectors)}
+        now = time.time()
+        with self.lock:
+            if self.conn is None: # Closed while waiting for the lock
+                return
+            placeholders = ",".join("?" * len(entries))
+            replaced_bytes = self.conn.execute(f"SELECT COALESCE(SUM(nbytes), 0) FROM embeddings WHERE model = ? AND kind = ? AND digest IN ({placeholders})",
+                                               [model, kind, *entries]).fetchone()[0]
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings (model, kind, digest, vector, nbytes, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                                  [(model, kind, digest, vector, len(vector), now) for digest, vector in entries.items()])
+            self.total_bytes += sum(len(vector) for vector in entries.values()) - replaced_bytes
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache is back under 90% of its cap."""
+        target = int(self.max_bytes * 0.9)
+        freed, evicted = 0, []
+        for model, kind, digest, nbytes in self.conn.execute("SELECT model, kind, digest, nbytes FROM embeddings ORDER BY last_used").fetchall():
+            if self.total_bytes - freed <= target: break
+            evicted.append((model, kind, digest)); freed += nbytes
+        self.conn.executemany("DELETE FROM embeddings WHERE model = ? AND kind = ? AND digest = ?", evicted)
+        self.total_bytes -= freed
+        print(f"Embedding cache: evicted {len(evicted)} least recently used entries ({freed / 1024 / 1024:.1f} MB).")
+
+    def describe(self):
+        lookups = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return f"Embedding cache: {self.hits}/{lookups} hits ({hit_rate:.1f}%), {self.bytes_saved / 1024:.1f} KB of embeddings served from disk"
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+class VectorIndexError(ValueError):
+    """Raised when a vector file has no valid header, was written with other settings, or fails its checksum."""
+
+
+class VectorIndexFile:
+    """Layout of a document's vector file, <key>.vec.
+
+    The file starts with a HEADER_SIZE-byte header: MAGIC, the length and CRC-32
+    of a JSON object, the object itself and zero padding. The JSON describes the
+    rows that follow (dim, dtype, rows, embedding model, whether rows are
+    normalized, the chunker signature) and, once the file is complete, the
+    CRC-32 of the row data. The rows are a plain row-major array, so the file
+    opens zero-copy with np.memmap at offset HEADER_SIZE.
+
+    During an ingest, rows are appended to <key>.vec.partial. The final header is
+    written into it before it is renamed to <key>.vec, so a file under the final
+    name is always complete.
+    """
+    MAGIC = b"OROVEC\x00\x01"
+    HEADER_SIZE = 4096 # One page, so the rows stay page-aligned for memory mapping
+    FORMAT_VERSION = 1
+    _PREFIX = len(MAGIC) + 8
+
+    @classmethod
+    def write_header(cls, f, header):
+        payload = json.dumps(dict(header, format_version=cls.FORMAT_VERSION), sort_keys=True).encode("utf-8")
+        if cls._PREFIX + len(payload) > cls.HEADER_SIZE:
+            raise VectorIndexError("Vector file header is too large")
+        data = cls.MAGIC + len(payload).to_bytes(4, "little") + zlib.crc32(payload).to_bytes(4, "little") + payload
+        f.seek(0)
+        f.write(data.ljust(cls.HEADER_SIZE, b"\0"))
+
+    @classmethod
+    def read_header(cls, path):
+        with open(path, "rb") as f:
+            data = f.read(cls.HEADER_SIZE)
+        if len(data) < cls.HEADER_SIZE or not data.startswith(cls.MAGIC):
+            raise VectorIndexError(f"'{os.path.basename(path)}' is not a vector index file")
+        length = int.from_bytes(data[len(cls.MAGIC):len(cls.MAGIC) + 4], "little")
+        payload = data[cls._PREFIX:cls._PREFIX + length]
+        if len(payload) != length or zlib.crc32(payload) != int.from_bytes(data[len(cls.MAGIC) + 4:cls._PREFIX], "little"):
+            raise VectorIndexError(f"The header of '{os.path.basename(path)}' is corrupt")
+        header = json.loads(payload)
+        if header.get("format_version") != cls.FORMAT_VERSION:
+            raise VectorIndexError(f"'{os.path.basename(path)}' uses vector file format {header.get('format_version')}")
+        return header
+
+    @staticmethod
+    def check(header, expected):
+        """Raises VectorIndexError naming the first header field that differs from `expected`."""
+        for field, value in expected.items():
+            if header.get(field) != value:
+                raise VectorIndexError(f"Vector file {field} is {header.get(field)!r}, expected {value!r}")
+
+    @classmethod
+    def open(cls, path, expected=None, max_rows=None):
+        """Validates the header and memory-maps the rows. Partial files expose the rows flushed so far.
+
+        Complete files must be exactly as long as their header says. The rows
+        themselves are not read; `verify` checks them against the CRC-32.
+        """
+        header = cls.read_header(path)
+        if expected: cls.check(header, expected)
+        row_bytes = header["dim"] * np.dtype(header["dtype"]).itemsize
+        file_size = os.path.getsize(path)
+        available = (file_size - cls.HEADER_SIZE) // row_bytes
+        if header["complete"]:
+            expected_size = cls.HEADER_SIZE + header["rows"] * row_bytes
+            if file_size != expected_size:
+                raise VectorIndexError(f"'{os.path.basename(path)}' is {file_size} bytes, expected {expected_size} for {header['rows']} rows")
+            available = header["rows"]
+        num_rows = available if max_rows is None else min(available, max_rows)
+        if num_rows <= 0:
+            raise VectorIndexError(f"'{os.path.basename(path)}' holds no rows")
+        return np.memmap(path, dtype=header["dtype"], mode='r', offset=cls.HEADER_SIZE, shape=(num_rows, header["dim"]))
+
+    @classmethod
+    def verify(cls, path):
+        """Reads a complete file's rows and raises VectorIndexError if they do not match the header's CRC-32."""
+        if cls.data_checksum(path) != cls.read_header(path)["checksum"]:
+            raise VectorIndexError(f"The vectors in '{os.path.basename(path)}' do not match their checksum")
+
+    @classmethod
+    def data_checksum(cls, path, length=None, block_bytes=1 << 20):
+        """CRC-32 of the row data, or of its first `length` bytes."""
+        checksum = 0
+        with open(path, "rb") as f:
+            f.seek(cls.HEADER_SIZE)
+            remaining = float("inf") if length is None else length
+            while remaining > 0:
+                data = f.read(int(min(block_bytes, remaining)))
+                if not data: break
+                checksum = zlib.crc32(data, checksum)
+                remaining -= len(data)
+        return checksum
+
+
+class IndexHandleCache:
+    """Process-wide LRU of opened vector files (memmaps or QuantizedVectors), bounded by their mapped bytes.
+
+    Repeated questions about the same documents reuse the open mapping, so they
+    skip the stat, header read and mmap calls and find its pages already warm.
+    Entries are keyed by index key and must be invalidated before their files are
+    deleted or replaced. `invalidate` bumps a generation counter so a handle
+    opened concurrently with an invalidation is not cached.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.handles = OrderedDict() # key -> (handle, mapped bytes)
+        self.mapped_bytes = 0
+        self.generation = 0
+        self.hits, self.misses = 0, 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _mapped_bytes(handle):
+        if isinstance(handle, QuantizedVectors):
+            return handle.codes.nbytes + (handle.exact.nbytes if handle.exact is not None else 0)
+        return handle.nbytes
+
+    def get(self, key, opener):
+        with self.lock:
+            entry = self.handles.get(key)
+            if entry is not None:
+                self.handles.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self.generation
+        handle = opener()
+        with self.lock:
+            if generation == self.generation and key not in self.handles:
+                size = self._mapped_bytes(handle)
+                self.handles[key] = (handle, size)
+                self.mapped_bytes += size
+                while self.mapped_bytes > self.max_bytes and len(self.handles) > 1:
+                    _, (_, evicted_size) = self.handles.popitem(last=False)
+                    self.mapped_bytes -= evicted_size
+        return handle
+
+    def invalidate(self, key):
+        with self.lock:
+            self.generation += 1
+            entry = self.handles.pop(key, None)
+            if entry is not None:
+                self.mapped_bytes -= entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.handles.clear()
+            self.mapped_bytes = 0
+
+    def describe(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return (f"Index handles: {len(self.handles)} open, {self.mapped_bytes / 1e6:.1f} MB mapped, "
+                    f"{self.hits}/{total} reused ({100 * self.hits / max(total, 1):.1f}%)")
+
+
+class VectorStoreWriter(threading.Thread):
+    """Appends embedded batches to a document's partial vector file on a background thread.
+
+    The queue is bounded, so the embedder blocks instead of buffering vectors in
+    memory when the disk falls behind. After each batch is flushed, its chunks are
+    handed to on_batch_written, which makes them searchable. `header` holds the
+    VectorIndexFile fields that describe where the vectors came from; `commit`
+    completes the header and moves the file to its final name.
+
+    When resuming, the first resume_rows rows of an existing file are kept. Their
+    batches are put with vectors=None and only pass their chunks through.
+    """
+    def __init__(self, path, on_batch_written, header, max_pending=WRITE_QUEUE_BATCHES, resume_rows=0, dim=None):
+        super().__init__(daemon=True)
+        self.path = path
+        self.on_batch_written = on_batch_written
+        self.header = dict(header, dtype="float16")
+        self.batches = queue.Queue(maxsize=max_pending)
+        self.resume_rows = resume_rows
+        self.rows_written, self.dim, self.error = 0, dim, None
+        self.checksum = None if resume_rows else 0 # CRC-32 of the first rows_written rows; None while kept rows are replayed
+
+    def run(self):
+        try:
+            with open(self.path, "r+b" if self.resume_rows else "wb") as f:
+                if self.resume_rows:
+                    # Drop any rows flushed after the last checkpoint; they are embedded again.
+                    kept_bytes = self.resume_rows * self.dim * np.dtype(np.float16).itemsize
+                    f.truncate(VectorIndexFile.HEADER_SIZE + kept_bytes)
+                    kept_checksum = VectorIndexFile.data_checksum(self.path, kept_bytes)
+                    f.seek(0, os.SEEK_END)
+                while True:
+                    item = self.batches.get()
+                    if item is None: break
+                    vectors, chunks = item
+                    if vectors is not None:
+                        if f.tell() == 0:
+                            VectorIndexFile.write_header(f, dict(self.header, dim=vectors.shape[1], rows=0, complete=False, checksum=None))
+                        data = np.ascontiguousarray(vectors, dtype=np.float16).tobytes()
+                        f.write(data)
+                        f.flush()
+                        self.checksum = zlib.crc32(data, self.checksum)
+                        self.dim = vectors.shape[1]
+                    self.rows_written += len(chunks)
+                    if self.checksum is None and self.rows_written >= self.resume_rows:
+                        self.checksum = kept_checksum
+                    self.on_batch_written(chunks)
+        except Exception as e:
+            self.error = e
+            # Keep draining so the producer never blocks on a full queue.
+            while self.batches.get() is not None: pass
+
+    def put(self, vectors, chunks):
+        if self.error: raise ValueError(f"Writing vectors failed: {self.error}")
+        self.batches.put((vectors, chunks))
+
+    def close(self):
+        self.batches.put(None)
+        self.join()
+        if self.error: raise ValueError(f"Writing vectors failed: {self.error}")
+
+    def sync(self):
+        """Forces the rows flushed so far onto the disk, so a checkpoint saved afterwards never claims rows a crash can lose."""
+        with open(self.path, "r+b") as f:
+            os.fsync(f.fileno())
+
+    def commit(self, final_path):
+        """Writes the final header (row count and data checksum) and renames the partial file to `final_path`."""
+        header = dict(self.header, dim=self.dim, rows=self.rows_written, complete=True, checksum=self.checksum)
+        with open(self.path, "r+b") as f:
+            VectorIndexFile.write_header(f, header)
+            f.flush()
+            os.fsync(f.fileno())
+        for attempt in range(10):
+            try:
+                os.replace(self.path, final_path)
+                return
+            except PermissionError:
+                # On Windows a search may still have the partial file mapped for a moment.
+                if attempt == 9: raise
+                time.sleep(0.1)
+
+
+class IngestCancelled(Exception):
+    """Raised inside an ingest when the user cancels it."""
+
+class GenerationStopped(Exception):
+    """Raised inside a chat, summary or review thread when the user presses Stop."""
+
+
+class _SocketTrackingBackend(httpcore.SyncBackend):
+    """httpcore network backend that remembers its sockets, so they can be shut down from another thread."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sockets, self.aborted = [], False
+
+    def connect_tcp(self, *args, **kwargs):
+        stream = super().connect_tcp(*args, **kwargs)
+        with self.lock:
+            self.sockets.append(stream.get_extra_info("socket"))
+            aborted = self.aborted
+        if aborted: self.abort() # Connected after Stop: drop it before the request is sent
+        return stream
+
+    def abort(self):
+        with self.lock:
+            self.aborted = True
+            sockets = list(self.sockets)
+        for sock in sockets:
+            try: sock.shutdown(socket.SHUT_RDWR)
+            except OSError: pass # Already closed
+
+
+class AbortableOllamaClient(ollama.Client):
+    """Ollama client for one chat, summary or review, whose requests Stop can cut off at once.
+
+    Closing an httpx client does not wake a thread blocked reading a response,
+    so a request whose prompt is still being evaluated would keep its server slot
+    until its first token. abort() shuts the sockets down instead: the blocked
+    read fails right away, and Ollama drops the request with the connection.
+    """
+    def __init__(self, host, timeout):
+        self.backend = _SocketTrackingBackend()
+        transport = httpx.HTTPTransport()
+        transport._pool = httpcore.ConnectionPool(network_backend=self.backend) # HTTPTransport has no network_backend option
+        super().__init__(host=host, timeout=timeout, transport=transport)
+
+    def abort(self):
+        self.backend.abort()
+
+
+class CheckpointMismatch(ValueError):
+    """Raised when a resumed ingest does not reproduce the chunks its checkpoint was written for."""
+
+
+class IngestCheckpoint:
+    """Records how many rows of a document's vector file are embedded and flushed to disk.
+
+    Saved as <key>.ckpt.json every CHECKPOINT_INTERVAL seconds while a document is
+    ingested, and once more when the ingest stops early. The chunking pipeline is
+    deterministic, so a restarted ingest produces the same chunks again, keeps the
+    first `rows` vectors from the file and embeds only the rest. A digest of the
+    committed chunk texts guards against resuming into a different chunk sequence,
+    and the CRC-32 of the committed rows against a vector file that changed since.
+    """
+    def __init__(self, path, info):
+        self.path, self.info = path, info
+        self.rows, self.dim, self.checksum = 0, None, None
+        self.digest = hashlib.sha1()
+        self.last_saved = time.time()
+
+    @staticmethod
+    def update_digest(digest, chunks):
+        for chunk in chunks:
+            digest.update(chunk["text"].encode("utf-8"))
+            digest.update(b"\0")
+
+    @staticmethod
+    def load(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def on_rows_written(self, chunks, writer):
+        """Called by the vector writer after a batch is flushed."""
+        self.update_digest(self.digest, chunks)
+        self.rows, self.dim, self.checksum = writer.rows_written, writer.dim, writer.checksum
+        if self.checksum is not None and time.time() - self.last_saved >= CHECKPOINT_INTERVAL:
+            self.save(writer)
+
+    def save(self, writer, cancelled=False):
+        writer.sync() # The rows reach the disk before the checkpoint that claims them
+        data = dict(self.info, version=INDEX_FORMAT_VERSION, rows=self.rows, dim=self.dim, checksum=self.checksum,
+                    digest=self.digest.hexdigest(), cancelled=cancelled, saved_at=time.time())
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.last_saved = time.time()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def reference_page_units(page_units, chunk_table):
+    """Returns page number -> saved text units, each [row, start, end, tokens, block_end] pointing into the chunk table.
+
+    Units are matched in document order, within PAGE_UNIT_SEARCH_ROWS rows of the
+    previous match. Units that are in no chunk (dropped as boilerplate, or part
+    of a duplicate chunk) are saved as [text, tokens, block_end] instead.
+    """
+    saved, row, pos, texts = {}, 0, 0, {}
+    for page in sorted(page_units):
+        entries = saved[page] = []
+        for text, tokens, block_end in page_units[page]:
+            for candidate in range(row, min(row + PAGE_UNIT_SEARCH_ROWS, len(chunk_table))):
+                if candidate not in texts: texts[candidate] = chunk_table.text_at(candidate)
+                start = texts[candidate].find(text, pos if candidate == row else 0)
+                if start >= 0:
+                    if candidate != row: texts = {r: t for r, t in texts.items() if r >= candidate}
+                    row, pos = candidate, start + len(text)
+                    entries.append([row, start, pos, tokens, block_end])
+                    break
+            else:
+                entries.append([text, tokens, block_end])
+    return saved
+
+class PreviousIndexVersion:
+    """The persisted index of an earlier version of a document, used when an edited copy is loaded.
+
+    Pages whose fingerprint is unchanged rebuild their text units from the
+    stored chunks instead of being parsed again, and chunks whose text is
+    unchanged reuse their stored vector instead of being embedded again.
+    """
+    def __init__(self, key, pages, chunks, vectors):
+        self.key = key
+        self.chunks = chunks
+        self.units_by_fingerprint = {page["fingerprint"]: page["units"] for page in pages}
+        self.rows_by_text = {}
+        for row, chunk in enumerate(chunks):
+            self.rows_by_text.setdefault(chunk["text"], row)
+        self.vectors = vectors # float16 memmap, or None if the earlier version's vectors cannot be reused
+        self.reused_pages, self.reused_rows = 0, 0
+
+    def page_units(self, fingerprint, page_num):
+        """Returns the text units of a page with this fingerprint, or None if the page has to be parsed."""
+        stored_units = self.units_by_fingerprint.get(fingerprint)
+        if stored_units is None:
+            return None
+        self.reused_pages += 1
+        units = []
+        for entry in stored_units:
+            if isinstance(entry[0], str):
+                text, tokens, block_end = entry
+            else:
+                row, start, end, tokens, block_end = entry
+                text = self.chunks[row]["text"][start:end]
+            units.append({"text": text, "page": page_num + 1, "tokens": tokens, "block_end": block_end})
+        return units
+
+    def lookup_vectors(self, texts):
+        """Returns the stored float16 row for each text, or None where the text is new."""
+        if self.vectors is None:
+            return [None] * len(texts)
+        rows = [self.rows_by_text.get(text) for text in texts]
+        self.reused_rows += sum(row is not None for row in rows)
+        return [None if row is None else np.array(self.vectors[row]) for row in rows]
+
+    def close(self):
+        self.vectors = None # Releases the memory map so the old files can be deleted
+
+
+class QuantizedVectors:
+    """Compressed, read-only replacement for a document's float16 vector file.
+
+    "int8" stores each row as int8 codes with a float32 scale (about 2x smaller
+    than float16). "pq" splits each row into subvectors of PQ_SUBVECTOR_DIMS
+    dimensions and stores the index of the nearest of 256 trained centroids per
+    subvector, one byte each (up to 2 * PQ_SUBVECTOR_DIMS times smaller, plus the
+    codebooks). Codes live in <key>.codes.npy and are memory-mapped; the scales
+    or codebooks are in <key>.codec.npz.
+
+    `score` ranks rows straight from the codes. Indexing returns approximate
+    float32 rows, which is good enough to train and assign IVF lists. `exact`
+    is the memory-mapped float16 file the codes were made from when
+    `keep_exact_vectors` kept it, or None; searches read only their best
+    candidates' rows from it to re-rank them.
+    """
+    KINDS = ("int8", "pq")
+
+    def __init__(self, kind, codes, params, info=None, exact=None):
+        self.kind = kind
+        self.codes = codes
+        self.params = params
+        self.info = info or {} # Header of the vector file the codes were made from
+        self.exact = exact
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def dim(self):
+        return self.codes.shape[1] if self.kind == "int8" else self.codes.shape[1] * self.params["codebooks"].shape[2]
+
+    @property
+    def shape(self):
+        return (len(self.codes), self.dim)
+
+    @classmethod
+    def encode(cls, kind, vectors, codes_path, codec_path, info=None, block_rows=SCORE_BLOCK_ROWS):
+        """Quantizes `vectors` (n x dim, usually a float16 memmap) and writes both files atomically."""
+        num_rows, dim = vectors.shape
+        if kind == "pq":
+            codebooks = cls._train_pq(vectors)
+            params = {"codebooks": codebooks}
+            codes_shape, codes_dtype = (num_rows, len(codebooks)), np.uint8
+        else:
+            params = {"scales": np.empty(num_rows, dtype=np.float32)}
+            codes_shape, codes_dtype = (num_rows, dim), np.int8
+
+        tmp_codes_path = codes_path + ".tmp.npy"
+        codes = np.lib.format.open_memmap(tmp_codes_path, mode="w+", dtype=codes_dtype, shape=codes_shape)
+        for start in range(0, num_rows, block_rows):
+            block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+            if kind == "pq":
+                codes[start:start + len(block)] = cls._assign_pq(codebooks, block)
+            else:
+                scales = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127
+                codes[start:start + len(block)] = np.rint(block / scales[:, np.newaxis])
+                params["scales"][start:start + len(block)] = scales
+        codes.flush()
+        del codes
+        tmp_codec_path = codec_path + ".tmp.npz"
+        np.savez(tmp_codec_path, kind=kind, info=json.dumps(info or {}), **{name: value.astype(np.float16) if name == "codebooks" else value
+                                               for name, value in params.items()})
+        os.replace(tmp_codes_path, codes_path)
+        os.replace(tmp_codec_path, codec_path)
+        return cls.open(codes_path, codec_path)
+
+    @classmethod
+    def open(cls, codes_path, codec_path, exact=None):
+        with np.load(codec_path) as data:
+            kind = str(data["kind"])
+            info = json.loads(str(data["info"])) if "info" in data.files else {}
+            params = {name: data[name].astype(np.float32) for name in data.files if name not in ("kind", "info")}
+        return cls(kind, np.load(codes_path, mmap_mode="r"), params, info, exact)
+
+    @staticmethod
+    def _train_pq(vectors, iterations=8, seed=0):
+        """Trains 256 centroids per subvector with k-means on a sample of rows. Returns (subvectors, 256, PQ_SUBVECTOR_DIMS)."""
+        rng = np.random.default_rng(seed)
+        num_rows, dim = vectors.shape
+        sample_rows = np.sort(rng.choice(num_rows, min(num_rows, PQ_TRAIN_SAMPLE), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32).reshape(len(sample_rows), -1, PQ_SUBVECTOR_DIMS)
+        num_centroids = min(256, len(sample))
+        codebooks = np.empty((sample.shape[1], num_centroids, PQ_SUBVECTOR_DIMS), dtype=np.float32)
+        for j in range(sample.shape[1]):
+            points = sample[:, j]
+            centroids = points[rng.choice(len(points), num_centroids, replace=False)].copy()
+            for _ in range(iterations):
+                assignments = np.argmax(points @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+                counts = np.bincount(assignments, minlength=num_centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignments, points)
+                used = counts > 0
+                centroids[used] = sums[used] / counts[used, np.newaxis]
+            codebooks[j] = centroids
+        return codebooks
+
+    @staticmethod
+    def _assign_pq(codebooks, block):
+        block = block.reshape(len(block), len(codebooks), -1)
+        half_norms = 0.5 * (codebooks ** 2).sum(axis=2)
+        codes = np.empty((len(block), len(codebooks)), dtype=np.uint8)
+        for j, centroids in enumerate(codebooks):
+            codes[:, j] = np.argmax(block[:, j] @ centroids.T - half_norms[j], axis=1)
+        return codes
+
+    def __getitem__(self, key):
+        codes = self.codes[key]
+        if self.kind == "pq":
+            codebooks = self.params["codebooks"]
+            return codebooks[np.arange(len(codebooks)), codes.astype(np.intp)].reshape(*codes.shape[:-1], -1)
+        return codes.astype(np.float32) * self.params["scales"][key][..., np.newaxis]
+
+    def score(self, key, query):
+        """Approximate dot products of `query` with the rows selected by `key`, computed from the codes."""
+        codes = self.codes[key]
+        if self.kind == "pq":
+            codebooks = self.params["codebooks"]
+            # Asymmetric distance: one table of subvector scores per query, then a lookup per code byte.
+            table = np.einsum("jcs,js->jc", codebooks, query.reshape(len(codebooks), -1))
+            return table[np.arange(len(codebooks)), codes.astype(np.intp)].sum(axis=1)
+        return (codes.astype(np.float32) @ query) * self.params["scales"][key]
+
+
+def blocked_top_k(vectors, query, top_k, rows=None, block_rows=SCORE_BLOCK_ROWS):
+    """Returns (scores, rows) of the top_k rows of `vectors` by dot product with `query`, best first.
+
+    `vectors` is usually a float16 memory map. It is read in blocks of
+    `block_rows` rows that are scored in float32, and only the best top_k seen
+    so far are kept, so memory stays bounded by the block size however large
+    the index is. `rows` restricts scoring to a subset of row numbers.
+    QuantizedVectors are scored from their codes.
+    """
+    query = np.asarray(query, dtype=np.float32)
+    num_rows = len(vectors) if rows is None else len(rows)
+    best_scores, best_rows = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+    for start in range(0, num_rows, block_rows):
+        stop = min(start + block_rows, num_rows)
+        if rows is None:
+            block_key = slice(start, stop)
+            block_row_ids = np.arange(start, stop, dtype=np.int64)
+        else:
+            block_key = block_row_ids = np.asarray(rows[start:stop], dtype=np.int64)
+        if isinstance(vectors, QuantizedVectors):
+            block_scores = vectors.score(block_key, query)
+        else:
+            block_scores = np.asarray(vectors[block_key], dtype=np.float32) @ query
+        best_scores = np.concatenate((best_scores, block_scores.astype(np.float32, copy=False)))
+        best_rows = np.concatenate((best_rows, block_row_ids))
+        if len(best_scores) > top_k:
+            keep = np.argpartition(best_scores, -top_k)[-top_k:]
+            best_scores, best_rows = best_scores[keep], best_rows[keep]
+    order = np.argsort(-best_scores, kind="stable")
+    return best_scores[order], best_rows[order]
+
+
+class IVFCodebook:
+    """Coarse quantizer for approximate search: k-means centroids shared by every document.
+
+    Each document stores which centroid ("inverted list") each of its rows is
+    closest to, in <key>.ivf.npz. A query is compared with the centroids first,
+    and only the rows in its `nprobe` closest lists are scored instead of every
+    row in the corpus. More lists probed means better recall and slower queries.
+    """
+    def __init__(self, centroids, trained_rows, codebook_id=None):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.trained_rows = trained_rows
+        self.codebook_id = codebook_id or hashlib.sha1(self.centroids.tobytes()).hexdigest()[:16]
+
+    @property
+    def num_lists(self):
+        return len(self.centroids)
+
+    @staticmethod
+    def suggested_lists(num_rows):
+        return int(min(4096, max(16, 4 * np.sqrt(num_rows))))
+
+    @classmethod
+    def train(cls, sample, num_lists, trained_rows, iterations=10, seed=0):
+        """Spherical k-means on normalized rows: assign by dot product, re-normalize the means."""
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(sample, dtype=np.float32)
+        num_lists = min(num_lists, len(sample))
+        centroids = sample[rng.choice(len(sample), num_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = cls._nearest(centroids, sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=num_lists)
+            empty = counts == 0
+            # Re-seed empty lists with random rows so every list stays in use.
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+        return cls(centroids, trained_rows)
+
+    @staticmethod
+    def _nearest(centroids, vectors, block_rows=16384):
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_rows):
+            block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+            assignments[start:start + block_rows] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    def build_lists(self, vectors):
+        """Groups a document's rows by nearest centroid. Returns (rows ordered by list, list start offsets)."""
+        assignments = self._nearest(self.centroids, vectors)
+        order = np.argsort(assignments, kind="stable").astype(np.int32)
+        offsets = np.zeros(self.num_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=self.num_lists), out=offsets[1:])
+        return order, offsets
+
+    def probe(self, query, nprobe):
+        scores = self.centroids @ query
+        nprobe = min(nprobe, self.num_lists)
+        return np.argpartition(scores, -nprobe)[-nprobe:]
+
+    @staticmethod
+    def candidate_rows(order, offsets, lists):
+        rows = np.concatenate([order[offsets[l]:offsets[l + 1]] for l in lists])
+        return np.sort(rows) # Ascending rows read the memory map sequentially
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, trained_rows=self.trained_rows, codebook_id=self.codebook_id)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], int(data["trained_rows"]), str(data["codebook_id"]))
+
+
+LEXICAL_TOKEN_RE = re.compile(r'[^\W_]+(?:[-./+][^\W_]+)*')
+
+class LexicalIndex:
+    """BM25 inverted index over one document's chunks, saved as <key>.bm25.npz.
+
+    Postings are stored CSR-style: the rows and term frequencies of term t are
+    rows[offsets[t]:offsets[t + 1]] and freqs[offsets[t]:offsets[t + 1]]. Terms
+    are lower-cased runs of letters and digits; compounds such as "H2-SO4",
+    "S-102" or "3.14" are indexed whole and by their parts, so exact identifiers
+    match even where embeddings blur them.
+    """
+    def __init__(self, terms, offsets, rows, freqs, lengths):
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets, self.rows, self.freqs, self.lengths = offsets, rows, freqs, lengths
+        self.avg_length = float(lengths.mean()) if len(lengths) else 1.0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @staticmethod
+    def tokenize(text):
+        tokens = LEXICAL_TOKEN_RE.findall(text.lower())
+        for compound in [token for token in tokens if not token.isalnum()]:
+            tokens.extend(part for part in re.split(r'[-./+]', compound) if len(part) > 1)
+        return tokens
+
+    @classmethod
+    def build(cls, texts):
+        term_ids, token_ids, lengths = {}, array('I'), array('I')
+        for text in texts:
+            tokens = cls.tokenize(text)
+            token_ids.extend([term_ids.setdefault(token, len(term_ids)) for token in tokens])
+            lengths.append(len(tokens))
+        lengths = np.frombuffer(lengths, dtype=np.uint32).astype(np.int32)
+        # Sorting (term, row) pairs yields the postings grouped by term, with the term frequency as the run length.
+        pairs = np.frombuffer(token_ids, dtype=np.uint32).astype(np.int64) * len(lengths) + np.repeat(np.arange(len(lengths)), lengths)
+        pairs, freqs = np.unique(pairs, return_counts=True)
+        offsets = np.searchsorted(pairs // len(lengths), np.arange(len(term_ids) + 1)) if len(pairs) else np.zeros(len(term_ids) + 1, dtype=np.int64)
+        rows = (pairs % len(lengths)).astype(np.int32) if len(pairs) else np.empty(0, dtype=np.int32)
+        return cls(list(term_ids), offsets.astype(np.int64), rows, np.minimum(freqs, 255).astype(np.uint8), lengths)
+
+    def search(self, query_text, top_k):
+        """Returns (scores, rows) of the top_k chunks by BM25 score, best first. Chunks sharing no term are left out."""
+        term_ids = {self.term_ids[term] for term in self.tokenize(query_text) if term in self.term_ids}
+        if not term_ids:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        num_rows = len(self.lengths)
+        scores = np.zeros(num_rows, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows, freqs = self.rows[start:end], self.freqs[start:end].astype(np.float32)
+            idf = np.log(1 + (num_rows - (end - start) + 0.5) / ((end - start) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[rows] / self.avg_length)
+            scores[rows] += idf * freqs * (BM25_K1 + 1) / (freqs + norm)
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(scores[matched], -top_k)[-top_k:]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return scores[matched], matched.astype(np.int64)
+
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        terms = "\n".join(self.term_ids).encode("utf-8")
+        np.savez(tmp_path, terms=np.frombuffer(terms, dtype=np.uint8), offsets=self.offsets, rows=self.rows,
+                 freqs=self.freqs, lengths=self.lengths)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            terms = data["terms"].tobytes().decode("utf-8")
+            return cls(terms.split("\n") if terms else [], data["offsets"], data["rows"], data["freqs"], data["lengths"])
+
+def pack_by_tokens(texts, budget_tokens):
+    """Groups consecutive texts so each group's estimated size stays within budget_tokens.
+
+    A text larger than the budget gets a group of its own.
+    """
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > budget_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+def split_into_sections(chunks, budget_tokens):
+    """Cuts a document's chunks into consecutive sections of at most budget_tokens each.
+
+    Each section's text labels its pages as '[Page X]:', like the chat context.
+    """
+    labelled, last_page = [], None
+    for chunk in chunks:
+        text = chunk["text"]
+        if chunk["page"] != last_page:
+            text, last_page = f"[Page {chunk['page']}]: {text}", chunk["page"]
+        labelled.append(text)
+    return ["\n".join(group) for group in pack_by_tokens(labelled, budget_tokens)]
+
+class SectionNotesCache:
+    """Section notes and merged notes of one document, persisted as '<key>.notes.json'.
+
+    Entries are keyed by a digest of the chat model, the prompt, the output cap
+    and the input text, so summaries and every reviewer role share them, and a
+    changed model or section size simply misses the cache.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.notes = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_FORMAT_VERSION:
+                self.notes = data.get("notes", {})
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def entry_key(model, system_prompt, max_tokens, text):
+        signature = f"{model}|{max_tokens}|{system_prompt}|{text}"
+        return hashlib.sha256(signature.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            return self.notes.get(key)
+
+    def put(self, key, notes):
+        """Stores one entry and rewrites the file, so finished sections survive an interrupted run."""
+        with self.lock:
+            self.notes[key] = notes
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_FORMAT_VERSION, "notes": self.notes}, f)
+            os.replace(tmp_path, self.path)
+
+class ChatHistoryManager:
+    """Keeps the history sent with each chat turn within a token budget.
+
+    Recent turns are sent verbatim; older ones are folded into a rolling
+    summary per session. The summary is updated in a background thread after
+    a turn, so a turn never waits for it: until it catches up, the oldest
+    unsummarized turns are left out instead.
+    """
+    def __init__(self, summarize):
+        self.summarize = summarize # (model, previous summary, messages, max_tokens) -> new summary
+        self.sessions = {} # session id -> {"summary", "folded": messages covered by the summary, "busy"}
+        self.lock = threading.Lock()
+
+    def _state(self, session_id):
+        return self.sessions.setdefault(session_id, {"summary": "", "folded": 0, "busy": False})
+
+    def build_messages(self, session_id, history, prompt, budget_tokens):
+        """Returns the summary, as many recent messages as fit in budget_tokens, and the new prompt."""
+        with self.lock:
+            state = dict(self._state(session_id))
+        used = estimate_tokens(prompt) + (estimate_tokens(state["summary"]) if state["summary"] else 0)
+        recent = []
+        for message in reversed(history[state["folded"]:]):
+            used += estimate_tokens(message["content"])
+            if used > budget_tokens: break
+            recent.insert(0, message)
+        while recent and recent[0]["role"] != "user":
+            recent.pop(0) # Start at a question, not in the middle of an exchange
+        messages = [{'role': 'system', 'content': f"Summary of the earlier conversation:\n{state['summary']}"}] if state["summary"] else []
+        return messages + recent + [{'role': 'user', 'content': prompt}]
+
+    def compact_in_background(self, session_id, history, model, budget_tokens):
+        """Folds older turns into the summary once the unsummarized ones fill three quarters of the budget.
+
+        The newest quarter of the budget stays verbatim, and the summary may take
+        another quarter, so the prompt prefix only changes every few turns.
+        """
+        with self.lock:
+            state = self._state(session_id)
+            folded = state["folded"]
+            if state["busy"] or sum(estimate_tokens(m["content"]) for m in history[folded:]) <= budget_tokens * 3 // 4:
+                return
+            cut, tail_tokens = len(history), 0
+            for i in range(len(history) - 1, folded - 1, -1):
+                tail_tokens += estimate_tokens(history[i]["content"])
+                if tail_tokens > budget_tokens // 4: break
+                if history[i]["role"] == "user": cut = i
+            if cut == len(history):
+                cut = max(folded, len(history) - 2) # The last exchange alone is over a quarter of the budget
+            if cut <= folded:
+                return
+            state["busy"] = True
+            previous_summary, messages = state["summary"], history[folded:cut]
+        threading.Thread(target=self._compact, args=(session_id, model, previous_summary, messages, folded, cut, budget_tokens // 4),
+                         daemon=True).start()
+
+    def _compact(self, session_id, model, previous_summary, messages, folded, cut, max_tokens):
+        try:
+            start_time = time.time()
+            summary = self.summarize(model, previous_summary, messages, max_tokens)
+            print(f"  [History] Folded {len(messages)} messages of '{session_id}' into its summary in {time.time() - start_time:.1f}s.")
+        except Exception as e:
+            summary = None
+            print(f"  [History] Could not update the summary of '{session_id}': {e}")
+        with self.lock:
+            state = self.sessions.get(session_id)
+            if state is None: return # The session was deleted meanwhile
+            state["busy"] = False
+            if summary and state["folded"] == folded:
+                state["summary"], state["folded"] = summary, cut
+
+    def forget(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
 
 
 class ResearchApp(tk.Tk):
@@ -151,6 +1745,7 @@ class ResearchApp(tk.Tk):
 
         self.app_config = self._load_config()
         self.cot_var = tk.BooleanVar(value=False)
+        self.corpus_search_var = tk.BooleanVar(value=False)
 
         # 1. Initialize core attributes
         self.ollama_client = None
@@ -160,14 +1755,43 @@ class ResearchApp(tk.Tk):
         self.embedding_model_available = False
         self.last_tok_per_sec = ""
         self.pdf_text_db = {}
+        self.doc_index_keys = {} # doc_id -> content-addressed key of its persisted index
+        self.doc_paths = {} # doc_id -> PDF path, so documents can be reopened under another embedding model
         self.chat_sessions = {}
         self.current_chat_id = None
         self.chat_counter = 0
-        self.processing_thread = None
+        self.ingest_queue = queue.Queue() # (doc_id, job) pairs waiting for an ingest worker
+        self.ingest_jobs = {} # doc_id -> job dict, for queued and running ingests
+        self.ingest_lock = threading.Lock()
+        self.ingest_active_keys = set() # Index keys being built; identical files wait for the first copy
+        self.ingest_key_released = threading.Condition(self.ingest_lock)
+        self.ingest_workers = []
+        self.ingest_results = {"loaded": 0, "failed": []} # Bulk ingest outcome, reported when the queue drains; guarded by ingest_lock
+        self.ivf_codebook = None # Centroids of the approximate (IVF) index for the current embedding model
+        self.ivf_lists = {} # doc_id -> (codebook id, rows ordered by list, list offsets)
+        self.ivf_lock = threading.Lock()
+        self.lexical_indexes = {} # doc_id -> LexicalIndex of a fully ingested document
+        self.shutting_down = False
+        self.checked_for_interrupted_ingests = False
+        self.parse_pool = None # Long-lived PDF parse workers, created on first ingest
+        self.parse_pool_size = 0
+        self.parse_pool_lock = threading.Lock()
         self._temp_review_doc_id = None
-        self._temp_review_full_text = None
+        self.section_notes = {} # index key -> SectionNotesCache of a summarized or reviewed document
+        self.section_notes_lock = threading.Lock()
+        self.history_manager = ChatHistoryManager(self._summarize_history)
+        self.active_generations = {} # Stop event -> AbortableOllamaClient of each running chat, summary and review thread
+        self.generation_lock = threading.Lock()
         self.vector_cache_dir = self.app_config.get("vector_cache_dir", "vector_cache")
         os.makedirs(self.vector_cache_dir, exist_ok=True)
+        self.embedding_cache = EmbeddingCache(os.path.join(self.vector_cache_dir, "embedding_cache.sqlite3"),
+                                              int(self.app_config.get("embedding_cache_max_mb", 256)) * 1024 * 1024)
+        self.index_handles = IndexHandleCache(int(self.app_config.get("index_cache_max_mb", 1024)) * 1024 * 1024)
+        self.chunker = make_chunker(self.app_config)
+        self.remove_boilerplate = bool(self.app_config.get("remove_boilerplate", True))
+        self.deduplicate_chunks = bool(self.app_config.get("deduplicate_chunks", True))
+        # Shared by all ingests so a learned concurrency level carries over to the next document.
+        self.embed_controller = AdaptiveConcurrencyController(self.app_config.get("embedding_max_concurrency") or cpu_count())
         self.title("Orochimaru - Local RAG AI")
         self.geometry("1200x800")
         self.configure(bg=Style.BG_PRIMARY)
@@ -219,6 +1843,8 @@ class ResearchApp(tk.Tk):
         menu = tk.Menu(self, tearoff=0)
         for role in ALL_REVIEWERS.keys():
             menu.add_command(label=role, command=lambda r=role: self._start_review_with_role(r))
+        menu.add_separator()
+        menu.add_command(label="Panel Review...", command=self._open_panel_review)
         
         # Display the menu at the current mouse position
         try:
@@ -229,9 +1855,14 @@ class ResearchApp(tk.Tk):
     def _start_review_with_role(self, reviewer_role):
         # Retrieve the temporarily stored document info
         doc_id = self._temp_review_doc_id
-        full_text = self._temp_review_full_text
 
-        threading.Thread(target=self.review_thread, args=(full_text, self.current_chat_id, reviewer_role), daemon=True).start()
+        threading.Thread(target=self.review_thread, args=(doc_id, self.current_chat_id, reviewer_role), daemon=True).start()
+
+    def _open_panel_review(self):
+        doc_id, chat_id = self._temp_review_doc_id, self.current_chat_id
+        experts = [role for role in ALL_REVIEWERS if role != "Chief Editor"]
+        window = PanelReviewWindow(self, doc_id, experts, lambda roles: threading.Thread(
+            target=self.panel_review_thread, args=(doc_id, chat_id, roles, window), daemon=True).start())
 
     def create_widgets(self):
         self._create_sidebar()
@@ -257,7 +1888,13 @@ class ResearchApp(tk.Tk):
 
         # --- Document Loading Section ---
         self.load_pdf_button = ttk.Button(self.sidebar, text=f"{Style.ICON_LOAD} Load Document", style='Accent.Sidebar.TButton', command=lambda: self.load_new_pdf())
-        self.load_pdf_button.pack(fill=tk.X, padx=15, pady=10, ipady=5)
+        self.load_pdf_button.pack(fill=tk.X, padx=15, pady=(10, 5), ipady=5)
+        self.load_folder_button = ttk.Button(self.sidebar, text=f"{Style.ICON_LOAD} Load Folder", style='Accent.Sidebar.TButton', command=lambda: self.load_pdf_folder())
+        self.load_folder_button.pack(fill=tk.X, padx=15, pady=(0, 5), ipady=5)
+        self.ingest_status_label = ttk.Label(self.sidebar, text="", style='Sidebar.TLabel', foreground=Style.FG_SECONDARY, justify=tk.LEFT, wraplength=280)
+        self.ingest_status_label.pack(fill=tk.X, padx=15, pady=(0, 5))
+        ttk.Button(self.sidebar, text="Cancel Ingest", style='Accent.Sidebar.TButton', command=self.cancel_ingest).pack(fill=tk.X, padx=15, pady=(0, 5))
+        ttk.Checkbutton(self.sidebar, text="Search all documents", variable=self.corpus_search_var, style='Tool.TCheckbutton').pack(anchor='w', padx=15, pady=(0, 5))
 
         ttk.Separator(self.sidebar, orient='horizontal').pack(fill='x', padx=15, pady=10)
 
@@ -269,6 +1906,7 @@ class ResearchApp(tk.Tk):
         self.model_var = tk.StringVar()
         self.model_selector = ttk.Combobox(model_controls_frame, textvariable=self.model_var, state="readonly")
         self.model_selector.pack(fill=tk.X, pady=(5,0))
+        self.model_selector.bind("<<ComboboxSelected>>", self.on_chat_model_select)
 
         ttk.Label(model_controls_frame, text="Temperature:", style='Sidebar.TLabel').pack(anchor='w', pady=(10,0))
         self.temperature_var = tk.DoubleVar(value=0.0)
@@ -380,6 +2018,9 @@ class ResearchApp(tk.Tk):
         self.entry_box.bind("<FocusOut>", self.on_entry_focus_out)
         self.bind('<Return>', lambda event: self.on_send_click())
         ttk.Button(input_frame, text=Style.ICON_SEND, command=self.on_send_click, style='Send.TButton').grid(row=0, column=1, padx=(10, 0))
+        self.stop_button = ttk.Button(input_frame, text=Style.ICON_STOP, command=self.on_stop_click, style='Send.TButton', state=tk.DISABLED)
+        self.stop_button.grid(row=0, column=2, padx=(5, 0))
+        self.bind('<Escape>', lambda event: self.on_stop_click())
 
     def start_services(self):
         print("--- Starting Application Services (TTS, Model Polling, UI Updates) ---")
@@ -391,6 +2032,14 @@ class ResearchApp(tk.Tk):
         
     def on_closing(self):
         self.stop_loading_event.set()
+        self.on_stop_click()
+        # Running ingests stop at their next batch and save a checkpoint to resume from on the next start.
+        self.shutting_down = True
+        deadline = time.time() + 3.0
+        while any(job["started"] for job in list(self.ingest_jobs.values())) and time.time() < deadline:
+            time.sleep(0.05)
+        self.embedding_cache.close()
+        self._shutdown_parse_pool()
         self._stop_ollama_server()
         self.destroy()
 
@@ -453,7 +2102,8 @@ class ResearchApp(tk.Tk):
             messagebox.showerror("Model Error", "Please select a valid chat model.")
             return
 
-        is_rag_chat = self.current_chat_id in self.pdf_text_db
+        is_corpus_chat = self.corpus_search_var.get() and any(len(chunks) for chunks in self.pdf_text_db.values())
+        is_rag_chat = is_corpus_chat or self.current_chat_id in self.pdf_text_db
         if is_rag_chat and not self.embedding_model_available:
             messagebox.showerror("Embedding Model Error", f"Cannot query document because the embedding model '{self.embedding_model_name}' is not available.")
             return
@@ -462,18 +2112,66 @@ class ResearchApp(tk.Tk):
         self.entry_box.config(state=tk.DISABLED); self.entry_box.delete(0, tk.END); self.add_placeholder()
 
         target_thread = self.rag_chat_thread if is_rag_chat else self.normal_chat_thread
-        args = (prompt,) if is_rag_chat else (prompt, self.chat_sessions[self.current_chat_id])
+        args = (prompt, is_corpus_chat) if is_rag_chat else (prompt, self.current_chat_id)
         threading.Thread(target=target_thread, args=args, daemon=True).start()
 
-    def stream_response_to_chat(self, response_stream):
+    def _begin_generation(self):
+        """Registers a chat, summary or review thread with the Stop button and returns its stop event.
+
+        The thread's chat requests go through its own AbortableOllamaClient (see
+        _chat_request), which Stop aborts.
+        """
+        stop_event = threading.Event()
+        with self.generation_lock:
+            self.active_generations[stop_event] = AbortableOllamaClient(host='127.0.0.1', timeout=300)
+        self.after(0, lambda: self.stop_button.config(state=tk.NORMAL))
+        return stop_event
+
+    def _end_generation(self, stop_event):
+        with self.generation_lock:
+            client = self.active_generations.pop(stop_event, None)
+            idle = not self.active_generations
+        if client is not None: client.close()
+        if idle: self.after(0, lambda: self.stop_button.config(state=tk.DISABLED))
+
+    def on_stop_click(self):
+        with self.generation_lock:
+            generations = list(self.active_generations.items())
+        if not generations: return
+        print(f"Stopping {len(generations)} running generation(s)...")
+        for stop_event, client in generations:
+            stop_event.set()
+            client.abort() # Drops requests still reading their prompt, including summary map requests
+        self.stop_loading_event.set(); self.entry_box.config(state=tk.NORMAL)
+
+    @staticmethod
+    def _iter_stream(response_stream, stop_event):
+        """Yields the chunks of an Ollama stream until stop_event is set, then closes the stream.
+
+        Closing the generator closes its HTTP response, and Ollama stops
+        generating as soon as the connection drops, freeing the model for the
+        next request. A stream whose connection Stop cut off simply ends.
+        """
+        try:
+            for chunk in response_stream:
+                if stop_event is not None and stop_event.is_set(): break
+                yield chunk
+        except Exception:
+            if stop_event is None or not stop_event.is_set(): raise
+        finally:
+            if hasattr(response_stream, "close"): response_stream.close()
+
+    def stream_response_to_chat(self, response_stream, stop_event=None):
         print("Streaming response to chat window...")
         full_response, token_batch = "", []
         token_count, start_time, last_update_time, update_interval = 0, time.time(), time.time(), 0.05
-        first_token_received = False
+        first_token_received, first_token_time, final_chunk = False, None, None
 
-        for chunk in response_stream:
+        for chunk in self._iter_stream(response_stream, stop_event):
             if not first_token_received:
                 self.after(0, lambda: self.entry_box.config(state=tk.NORMAL)); first_token_received = True
+                first_token_time = time.time()
+            if chunk.get('done'): final_chunk = chunk
             
             token = chunk['message']['content']
             full_response += token
@@ -486,36 +2184,50 @@ class ResearchApp(tk.Tk):
                 self.after(0, self.append_to_chat, "".join(token_batch)); token_batch.clear(); last_update_time = time.time()
 
         if token_batch: self.after(0, self.append_to_chat, "".join(token_batch))
+        if stop_event is not None and stop_event.is_set():
+            print(f"  - Stopped after {token_count} tokens; the partial answer is kept.")
+            self.after(0, self.append_to_chat, " [Stopped]", "thinking_tag")
 
         self.last_tok_per_sec = f"Tok/s: {token_count / (time.time() - start_time):.2f}" if time.time() > start_time else "Tok/s: --"
+        if first_token_time:
+            self.last_tok_per_sec += f"  |  TTFT: {first_token_time - start_time:.2f}s"
+            self._log_response_timing(first_token_time - start_time, final_chunk)
         if self.current_chat_id: self.chat_sessions[self.current_chat_id].append({'role': 'assistant', 'content': full_response})
         print("Finished streaming response.")
         self.after(0, self.finalize_response)
 
-    def find_relevant_chunks(self, query_vector, doc_id, top_k=5):
+    def _log_response_timing(self, ttft, final_chunk):
+        """Prints time to first token and Ollama's own load and prompt-evaluation times for the last answer."""
+        line = f"  [Timing] Time to first token: {ttft:.2f}s"
+        if final_chunk is not None and final_chunk.get('prompt_eval_duration') is not None:
+            # Ollama reports durations in nanoseconds; prompt tokens served from its cache are not evaluated again.
+            line += (f" (model load {(final_chunk.get('load_duration') or 0) / 1e9:.2f}s,"
+                     f" {final_chunk.get('prompt_eval_count') or 0} prompt tokens evaluated in {final_chunk['prompt_eval_duration'] / 1e9:.2f}s)")
+        print(line)
+
+    def find_relevant_chunks(self, query_vector, doc_id, top_k=5, query_text=None):
         print(f"Finding top {top_k} relevant chunks for document '{doc_id}'...")
         if doc_id not in self.pdf_text_db:
             print(f"  - Error: Document ID '{doc_id}' not found in text database.")
             return []
 
-        mmap_path = os.path.join(self.vector_cache_dir, f"{doc_id}.mmap")
-        if not os.path.exists(mmap_path):
-            print(f"  - Error: Vector cache file not found at {mmap_path}")
-            return []
-
         num_chunks = len(self.pdf_text_db[doc_id])
         if num_chunks == 0:
             print("  - Warning: Document has no chunks to search.")
             return []
         print(f"  - Found {num_chunks} chunks for document '{doc_id}'.")
         
-        try:
-            # Vectors are pre-normalized, so we can load them directly.
-            mmap_vectors = np.memmap(mmap_path, dtype=np.float16, mode='r', shape=(num_chunks, len(query_vector)))
-            print(f"  - Successfully loaded vector cache from {mmap_path}")
-        except ValueError:
-            print(f"  - Warning: Could not load mmap for {doc_id} with expected shape. Re-processing might be needed.")
+        # Vectors are pre-normalized, so they can be scored directly.
+        vectors = self._open_document_vectors(doc_id)
+        if vectors is None:
+            print(f"  - Error: No usable vector file for '{doc_id}' in {self.vector_cache_dir}")
+            return []
+        print(f"  - {self.index_handles.describe()}")
+        if vectors.shape[1] != len(query_vector):
+            print(f"  - Error: '{doc_id}' has {vectors.shape[1]}-dim vectors but the query has {len(query_vector)} dims.")
             return []
+        if isinstance(vectors, QuantizedVectors):
+            print(f"  - Searching {vectors.kind} codes, re-ranking the best {top_k * RERANK_FACTOR} exactly.")
 
         # Normalize the query vector. Use float32 for precision.
         query_vector = np.array(query_vector, dtype=np.float32)
@@ -527,82 +2239,538 @@ class ResearchApp(tk.Tk):
         query_vector_norm = query_vector / query_norm
         print("  - Query vector normalized.")
 
-        # The dot product of two normalized vectors is the cosine similarity.
-        # Cast query vector to the same dtype as mmap_vectors for dot product.
-        similarities = np.dot(mmap_vectors, query_vector_norm.astype(mmap_vectors.dtype))
-        print("  - Calculated similarities for all chunks.")
+        nprobe = self._ann_nprobe(num_chunks)
+        if nprobe is not None and doc_id in self.ivf_lists:
+            print(f"  - Approximate search: probing {nprobe} of {self.ivf_codebook.num_lists} lists.")
+        else:
+            nprobe = None
 
-        # Get the indices of the top k similarities, sorted from highest to lowest.
-        top_k_indices = np.argsort(similarities)[-top_k:][::-1]
-        print(f"  - Identified top {len(top_k_indices)} indices: {top_k_indices}")
+        # The dot product of two normalized vectors is the cosine similarity.
+        results = self._hybrid_search([doc_id], query_vector_norm, query_text, top_k, nprobe)
+        print(f"  - Kept the top {len(results)} chunks: {[row for _, _, row in results]}")
 
         relevant_chunks = []
-        for i in top_k_indices:
+        for similarity_score, _, i in results:
             chunk_info = self.pdf_text_db[doc_id][i]
-            similarity_score = similarities[i]
-            relevant_chunks.append((chunk_info['text'], similarity_score, chunk_info['page']))
-            print(f"    - Retrieved chunk from Page {chunk_info['page']} with similarity: {similarity_score:.4f}")
+            relevant_chunks.append((chunk_info['text'], similarity_score, format_pages(chunk_info)))
+            print(f"    - Retrieved chunk from {format_pages(chunk_info)} with score: {similarity_score:.4f}")
         
         print("Finished finding relevant chunks.")
         return relevant_chunks
 
-    def rag_chat_thread(self, prompt):
+    def _open_document_vectors(self, doc_id):
+        """Memory-maps a document's vectors for the rows that are searchable so far, or returns None.
+
+        Documents stored in a quantized format return their QuantizedVectors.
+        Finished documents come from the index handle cache.
+        """
+        num_chunks = len(self.pdf_text_db.get(doc_id, ()))
+        if num_chunks == 0:
+            return None
+        key = self.doc_index_keys.get(doc_id, doc_id)
+        try:
+            if self._is_ingesting(doc_id):
+                # The files are still growing or being replaced, so they are mapped afresh each time.
+                partial_path = self._get_partial_vector_path(doc_id)
+                if os.path.exists(partial_path):
+                    return VectorIndexFile.open(partial_path, self._vector_header_fields(), max_rows=num_chunks)
+                vectors = self._open_index_vectors(key)
+            else:
+                vectors = self.index_handles.get(key, lambda: self._open_index_vectors(key))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"  - Cannot search '{doc_id}': {e}")
+            return None
+        return vectors if len(vectors) == num_chunks else None
+
+    def _open_index_vectors(self, key):
+        """Opens the finished vectors stored under `key`: the quantized codes if there are any, else the float16 file."""
+        vector_path = self._get_index_file(key, ".vec")
+        codes_path = self._get_index_file(key, ".codes.npy")
+        if not os.path.exists(codes_path):
+            return VectorIndexFile.open(vector_path, self._vector_header_fields())
+        exact = VectorIndexFile.open(vector_path, self._vector_header_fields()) if os.path.exists(vector_path) else None
+        return QuantizedVectors.open(codes_path, self._get_index_file(key, ".codec.npz"), exact=exact)
+
+    def _get_ivf_codebook_path(self):
+        model_name = re.sub(r'[^\w.-]', '_', self.embedding_model_name)
+        return os.path.join(self.vector_cache_dir, f"ivf_{model_name}.npz")
+
+    def _get_ivf_codebook(self):
+        if self.ivf_codebook is None and os.path.exists(self._get_ivf_codebook_path()):
+            try:
+                self.ivf_codebook = IVFCodebook.load(self._get_ivf_codebook_path())
+            except (OSError, ValueError, KeyError) as e:
+                print(f"  - Could not load the IVF centroids: {e}")
+        return self.ivf_codebook
+
+    def _update_ann_index(self, doc_id):
+        """Keeps the approximate index in step with the loaded documents. Runs on an ingest worker thread.
+
+        The centroids are trained once the loaded corpus reaches ann_min_chunks
+        rows and retrained when it has grown ANN_RETRAIN_GROWTH times since. Each
+        document's inverted lists are built when it is loaded and saved next to
+        its vectors.
+        """
+        ann_min_chunks = int(self.app_config.get("ann_min_chunks", 50000))
+        if ann_min_chunks <= 0:
+            return
+        with self.ivf_lock:
+            doc_ids = [d for d, chunks in list(self.pdf_text_db.items()) if (len(chunks) and not self._is_ingesting(d)) or d == doc_id]
+            total_rows = sum(len(self.pdf_text_db[d]) for d in doc_ids)
+            codebook = self._get_ivf_codebook()
+            if total_rows >= ann_min_chunks and (codebook is None or total_rows >= codebook.trained_rows * ANN_RETRAIN_GROWTH):
+                codebook = self._train_ivf_codebook(doc_ids, total_rows)
+                for other_doc_id in doc_ids:
+                    self._ensure_ivf_lists(other_doc_id, codebook)
+                self._check_ann_recall(doc_ids)
+            elif codebook is not None:
+                self._ensure_ivf_lists(doc_id, codebook)
+
+    def _train_ivf_codebook(self, doc_ids, total_rows):
+        start_time = time.time()
+        rng = np.random.default_rng(0)
+        sample_parts = []
+        for doc_id in doc_ids:
+            vectors = self._open_document_vectors(doc_id)
+            if vectors is None: continue
+            take = max(1, int(round(len(vectors) * min(1.0, ANN_TRAIN_SAMPLE / total_rows))))
+            sample_parts.append(np.asarray(vectors[np.sort(rng.choice(len(vectors), min(take, len(vectors)), replace=False))], dtype=np.float32))
+        sample = np.concatenate(sample_parts)
+        num_lists = IVFCodebook.suggested_lists(total_rows)
+        print(f"Training IVF index: {num_lists} lists from {len(sample)} of {total_rows} chunks...")
+        codebook = IVFCodebook.train(sample, num_lists, total_rows)
+        codebook.save(self._get_ivf_codebook_path())
+        self.ivf_codebook = codebook
+        print(f"  - IVF centroids trained in {time.time() - start_time:.1f}s.")
+        return codebook
+
+    def _ensure_ivf_lists(self, doc_id, codebook):
+        """Loads or builds a document's inverted lists for the given centroids."""
+        cached = self.ivf_lists.get(doc_id)
+        if cached is not None and cached[0] == codebook.codebook_id:
+            return
+        lists_path = self._get_index_file(self.doc_index_keys.get(doc_id, doc_id), ".ivf.npz")
+        try:
+            with np.load(lists_path) as data:
+                if str(data["codebook_id"]) == codebook.codebook_id and int(data["offsets"][-1]) == len(self.pdf_text_db[doc_id]):
+                    self.ivf_lists[doc_id] = (codebook.codebook_id, data["order"], data["offsets"])
+                    return
+        except (OSError, ValueError, KeyError):
+            pass
+
+        vectors = self._open_document_vectors(doc_id)
+        if vectors is None:
+            return
+        order, offsets = codebook.build_lists(vectors)
+        np.savez(lists_path[:-len(".npz")] + ".tmp.npz", codebook_id=codebook.codebook_id, order=order, offsets=offsets)
+        os.replace(lists_path[:-len(".npz")] + ".tmp.npz", lists_path)
+        self.ivf_lists[doc_id] = (codebook.codebook_id, order, offsets)
+
+    def _search_documents(self, doc_ids, query_vector, top_k, nprobe=None, rerank=True):
+        """Scores a normalized float32 query against the given documents and returns the global top-k.
+
+        Documents with inverted lists for the current centroids only score the rows
+        in the `nprobe` closest lists (all rows when nprobe is None); the others
+        are scored exhaustively. Quantized documents contribute RERANK_FACTOR times
+        more candidates, which are then re-scored with their exact embeddings
+        unless `rerank` is False. Returns (score, doc_id, row) tuples, best first.
+        """
+        codebook = self.ivf_codebook
+        probed_lists = codebook.probe(query_vector, nprobe) if codebook is not None and nprobe else None
+        scores, owners, rows, quantized_docs = [], [], [], {}
+        for doc_id in doc_ids:
+            vectors = self._open_document_vectors(doc_id)
+            if vectors is None: continue
+            doc_top_k = top_k
+            if isinstance(vectors, QuantizedVectors):
+                quantized_docs[doc_id] = vectors
+                doc_top_k = top_k * RERANK_FACTOR
+            doc_lists = self.ivf_lists.get(doc_id)
+            candidate_rows = None
+            if probed_lists is not None and doc_lists is not None and doc_lists[0] == codebook.codebook_id:
+                candidate_rows = IVFCodebook.candidate_rows(doc_lists[1], doc_lists[2], probed_lists)
+                candidate_rows = candidate_rows[candidate_rows < len(vectors)]
+            doc_scores, doc_rows = blocked_top_k(vectors, query_vector, doc_top_k, rows=candidate_rows)
+            scores.append(doc_scores); rows.append(doc_rows); owners.extend([doc_id] * len(doc_rows))
+        if not owners:
+            return []
+        scores, rows = np.concatenate(scores), np.concatenate(rows)
+        best = np.argsort(-scores, kind="stable")[:top_k * RERANK_FACTOR if quantized_docs else top_k]
+        results = [(float(scores[i]), owners[i], int(rows[i])) for i in best]
+        if quantized_docs and rerank:
+            results = self._rerank_exact(results, query_vector, quantized_docs)
+        return results[:top_k]
+
+    def _rerank_exact(self, results, query_vector, quantized_docs):
+        """Replaces the approximate scores of quantized rows with exact scores where the full vectors are at hand.
+
+        `quantized_docs` maps doc_id -> QuantizedVectors. Candidate rows are read
+        from the document's float16 file when `keep_exact_vectors` kept it, and
+        otherwise looked up in the embedding cache. Nothing is embedded again;
+        rows the cache no longer holds keep their approximate score.
+        """
+        results = list(results)
+        for doc_id, vectors in quantized_docs.items():
+            positions = [i for i, (_, owner, _) in enumerate(results) if owner == doc_id]
+            if not positions: continue
+            if vectors.exact is not None:
+                rows = np.array([results[i][2] for i in positions], dtype=np.int64)
+                exact_vectors = list(np.asarray(vectors.exact[rows], dtype=np.float32))
+            else:
+                texts = [self.pdf_text_db[doc_id].text_at(results[i][2]) for i in positions]
+                exact_vectors = self.embedding_cache.get_many(self.embedding_model_name, texts)
+            for i, vector in zip(positions, exact_vectors):
+                if vector is not None:
+                    results[i] = (float(vector @ query_vector),) + results[i][1:]
+        return sorted(results, key=lambda result: -result[0])
+
+    def _build_lexical_index(self, doc_id):
+        start_time = time.time()
+        table = self.pdf_text_db[doc_id]
+        lexical_index = LexicalIndex.build(table.text_at(i) for i in range(len(table)))
+        lexical_index.save(self._get_index_file(self.doc_index_keys.get(doc_id, doc_id), ".bm25.npz"))
+        self.lexical_indexes[doc_id] = lexical_index
+        print(f"  - Built keyword index: {len(lexical_index.term_ids)} terms, {len(lexical_index.rows)} postings "
+              f"in {time.time() - start_time:.2f}s.")
+
+    def _lexical_search(self, doc_ids, query_text, top_k):
+        """BM25 top-k over the documents' keyword indexes. Returns (score, doc_id, row) tuples, best first."""
+        results = []
+        for doc_id in doc_ids:
+            lexical_index = self.lexical_indexes.get(doc_id)
+            if lexical_index is None: continue # Still being ingested: searched by vector only
+            scores, rows = lexical_index.search(query_text, top_k)
+            results.extend((float(score), doc_id, int(row)) for score, row in zip(scores, rows))
+        return sorted(results, key=lambda result: -result[0])[:top_k]
+
+    def _hybrid_search(self, doc_ids, query_vector, query_text, top_k, nprobe=None):
+        """Fuses vector and BM25 rankings with reciprocal rank fusion. Returns (score, doc_id, row) tuples, best first.
+
+        Falls back to vector search alone when `hybrid_search` is off or the
+        query shares no term with the documents.
+        """
+        if not query_text or not self.app_config.get("hybrid_search", True):
+            return self._search_documents(doc_ids, query_vector, top_k, nprobe)
+        start_time = time.time()
+        lexical = self._lexical_search(doc_ids, query_text, top_k * HYBRID_CANDIDATES)
+        lexical_ms = (time.time() - start_time) * 1000
+        vector = self._search_documents(doc_ids, query_vector, top_k * HYBRID_CANDIDATES, nprobe)
+        if not lexical:
+            return vector[:top_k]
+        fused = {}
+        for ranking in (vector, lexical):
+            for rank, (_, doc_id, row) in enumerate(ranking):
+                fused[(doc_id, row)] = fused.get((doc_id, row), 0.0) + 1.0 / (RRF_K + rank + 1)
+        print(f"  - Hybrid search: {len(lexical)} keyword matches ({lexical_ms:.2f} ms), {len(vector)} vector matches.")
+        best = sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+        return [(score, doc_id, row) for (doc_id, row), score in best]
+
+    def _has_index_vectors(self, doc_id):
+        key = self.doc_index_keys.get(doc_id, doc_id)
+        return any(os.path.exists(path) for path in (self._get_vector_path(doc_id), self._get_partial_vector_path(doc_id),
+                                                     self._get_index_file(key, ".codes.npy")))
+
+    def _quantize_index(self, doc_id, dim):
+        """Re-encodes a finished document's vector file in the configured `vector_storage` format. Returns the format used.
+
+        The codes replace the float16 file unless `keep_exact_vectors` is set.
+        """
+        storage = self.app_config.get("vector_storage", "float16")
+        if storage not in QuantizedVectors.KINDS:
+            return "float16"
+        num_rows = len(self.pdf_text_db[doc_id])
+        if storage == "pq" and (num_rows < PQ_MIN_ROWS or dim % PQ_SUBVECTOR_DIMS):
+            print(f"  - {num_rows} chunks of {dim} dims are too few for product quantization; storing int8 instead.")
+            storage = "int8"
+        start_time = time.time()
+        key = self.doc_index_keys.get(doc_id, doc_id)
+        vectors = VectorIndexFile.open(self._get_vector_path(doc_id))
+        QuantizedVectors.encode(storage, vectors, self._get_index_file(key, ".codes.npy"), self._get_index_file(key, ".codec.npz"),
+                                VectorIndexFile.read_header(self._get_vector_path(doc_id)))
+        del vectors
+        float16_size = os.path.getsize(self._get_vector_path(doc_id))
+        quantized_size = sum(os.path.getsize(self._get_index_file(key, ext)) for ext in (".codes.npy", ".codec.npz"))
+        if quantized_size >= float16_size:
+            print(f"  - {storage} codes would not be smaller than float16 for {num_rows} chunks; keeping float16.")
+            for ext in (".codes.npy", ".codec.npz"): os.remove(self._get_index_file(key, ext))
+            return "float16"
+        if self.app_config.get("keep_exact_vectors", False):
+            print(f"  - Stored {storage} codes next to the float16 vectors for exact re-ranking: "
+                  f"{(quantized_size + float16_size) / 1e6:.2f} MB of vectors on disk ({time.time() - start_time:.1f}s).")
+            return storage
+        try:
+            os.remove(self._get_vector_path(doc_id)) # The codes replace the float16 file
+        except OSError as e:
+            print(f"  - Could not remove the float16 vector file: {e}")
+            return storage
+        print(f"  - Stored vectors as {storage}: {quantized_size / 1e6:.2f} MB on disk instead of {float16_size / 1e6:.2f} MB "
+              f"({float16_size / quantized_size:.1f}x smaller, {time.time() - start_time:.1f}s).")
+        return storage
+
+    def _ann_nprobe(self, num_rows):
+        """Returns the number of lists to probe, or None when the approximate index should not be used."""
+        ann_min_chunks = int(self.app_config.get("ann_min_chunks", 50000))
+        if ann_min_chunks <= 0 or num_rows < ann_min_chunks or self._get_ivf_codebook() is None:
+            return None
+        return max(1, int(self.app_config.get("ann_nprobe", 16)))
+
+    def _check_ann_recall(self, doc_ids, num_queries=32, top_k=10):
+        """Measures recall@k of the approximate index against exhaustive search for several nprobe values."""
+        rng = np.random.default_rng(1)
+        owners = [d for d in doc_ids if self._open_document_vectors(d) is not None]
+        if not owners: return
+        queries = []
+        for _ in range(num_queries):
+            vectors = self._open_document_vectors(owners[rng.integers(len(owners))])
+            # A perturbed chunk vector stands in for a question about that passage.
+            query = np.asarray(vectors[rng.integers(len(vectors))], dtype=np.float32)
+            query = query + rng.normal(0, 0.5 / np.sqrt(len(query)), len(query)).astype(np.float32)
+            queries.append(query / np.linalg.norm(query))
+
+        exact = [{(d, r) for _, d, r in self._search_documents(owners, q, top_k, rerank=False)} for q in queries]
+        configured = int(self.app_config.get("ann_nprobe", 16))
+        print(f"  - IVF recall@{top_k} vs. exhaustive search ({num_queries} sample queries):")
+        nprobe = 1
+        while nprobe <= min(self.ivf_codebook.num_lists, 256):
+            start_time = time.time()
+            found = [{(d, r) for _, d, r in self._search_documents(owners, q, top_k, nprobe, rerank=False)} for q in queries]
+            elapsed_ms = (time.time() - start_time) * 1000 / num_queries
+            recall = np.mean([len(a & e) / max(len(e), 1) for a, e in zip(found, exact)])
+            print(f"      nprobe {nprobe:>4}: recall {recall:.3f}, {elapsed_ms:.1f} ms/query{'  <- ann_nprobe' if nprobe == configured else ''}")
+            nprobe *= 2
+
+    def find_relevant_chunks_in_corpus(self, query_vector, top_k=8, query_text=None):
+        """Scores the query against every loaded document, one block at a time. Returns (text, score, page, doc_id) tuples."""
+        query_vector = np.array(query_vector, dtype=np.float32)
+        query_norm = np.linalg.norm(query_vector)
+        if query_norm == 0:
+            print("  - Error: Query vector is zero, cannot compute similarity.")
+            return []
+
+        doc_ids = [doc_id for doc_id, chunks in list(self.pdf_text_db.items()) if len(chunks)]
+        nprobe = self._ann_nprobe(sum(len(self.pdf_text_db[doc_id]) for doc_id in doc_ids))
+        if nprobe is not None:
+            print(f"  - Approximate search: probing {nprobe} of {self.ivf_codebook.num_lists} lists.")
+        results = self._hybrid_search(doc_ids, query_vector / query_norm, query_text, top_k, nprobe)
+        if not results:
+            print("  - Warning: No document vectors to search.")
+            return []
+
+        relevant_chunks = []
+        for score, doc_id, row in results:
+            chunk_info = self.pdf_text_db[doc_id][row]
+            relevant_chunks.append((chunk_info['text'], score, format_pages(chunk_info), doc_id))
+            print(f"    - Retrieved chunk from '{doc_id}', {format_pages(chunk_info)} with score: {score:.4f}")
+        return relevant_chunks
+
+    def rag_chat_thread(self, prompt, corpus=False):
+        stop_event = self._begin_generation()
         try:
             print("Executing RAG chat thread...")
             self.stop_loading_event.clear(); threading.Thread(target=self.run_loading_animation, daemon=True).start()
-            self.after(0, lambda: self.append_to_chat(f"{self.model_var.get().split(':')[0].capitalize()} (Doc): ", "bot_name_tag"))
+            self.after(0, lambda: self.append_to_chat(f"{self.model_var.get().split(':')[0].capitalize()} ({'Library' if corpus else 'Doc'}): ", "bot_name_tag"))
 
             print("Generating embeddings for RAG query...")
-            query_vector = self.ollama_client.embeddings(model=self.embedding_model_name, prompt=prompt)['embedding']
-            print("Finding relevant chunks from document...")
-            chunks = self.find_relevant_chunks(query_vector, self.current_chat_id, top_k=5)
-            context = "\n\n".join([f"[Page {p}]: {t}" for t, _, p in chunks]) or "No relevant context found."
-            
-            system_prompt = f"{NORMAL_RAG_SYSTEM_PROMPT}\n\n--- CONTEXT ---\n{context}\n--- END CONTEXT ---"
-            messages = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': prompt}]
+            query_vector = self._embed_query(prompt)
+            if corpus:
+                print("Finding relevant chunks across all loaded documents...")
+                chunks = self.find_relevant_chunks_in_corpus(query_vector, top_k=8, query_text=prompt)
+                context = "\n\n".join([f"[{d}, {p}]: {t}" for t, _, p, d in chunks]) or "No relevant context found."
+                messages = build_rag_messages(CORPUS_RAG_SYSTEM_PROMPT, "The questions are about all documents in the user's library.", context, prompt)
+            else:
+                print("Finding relevant chunks from document...")
+                chunks = self.find_relevant_chunks(query_vector, self.current_chat_id, top_k=5, query_text=prompt)
+                context = "\n\n".join([f"[{p}]: {t}" for t, _, p in chunks]) or "No relevant context found."
+                messages = build_rag_messages(NORMAL_RAG_SYSTEM_PROMPT, f"The questions are about the document '{self.current_chat_id}'.", context, prompt)
+            if stop_event.is_set(): raise GenerationStopped()
             print(f"Sending chat request to model '{self.model_var.get()}'...")
-            response = self.ollama_client.chat(model=self.model_var.get(), messages=messages, stream=True)
-            self.stream_response_to_chat(response)
             self.chat_sessions[self.current_chat_id].append({'role': 'user', 'content': prompt})
+            response = self._chat_request(self.model_var.get(), messages, stream=True, stop_event=stop_event)
+            self.stream_response_to_chat(response, stop_event)
+        except GenerationStopped:
+            self.after(0, self.append_to_chat, "[Stopped]\n\n", "thinking_tag")
         except Exception as e:
             self.after(0, self.append_to_chat, f"\nError in RAG thread: {e}\n\n", "error_tag")
         finally:
+            self._end_generation(stop_event)
             self.stop_loading_event.set(); self.after(0, lambda: self.entry_box.config(state=tk.NORMAL))
 
-    def normal_chat_thread(self, prompt, message_history):
+    def normal_chat_thread(self, prompt, chat_id):
+        stop_event = self._begin_generation()
         try:
             print("Executing normal chat thread...")
             self.stop_loading_event.clear(); threading.Thread(target=self.run_loading_animation, daemon=True).start()
-            self.after(0, lambda: self.append_to_chat(f"{self.model_var.get().split(':')[0].capitalize()} (Chat): ", "bot_name_tag"))
+            model = self.model_var.get()
+            self.after(0, lambda: self.append_to_chat(f"{model.split(':')[0].capitalize()} (Chat): ", "bot_name_tag"))
             
-            print(f"Sending chat request to model '{self.model_var.get()}'...")
-            response = self.ollama_client.chat(model=self.model_var.get(), messages=message_history + [{'role': 'user', 'content': prompt}], stream=True)
-            self.stream_response_to_chat(response)
+            message_history, budget = self.chat_sessions[chat_id], self._history_budget(model)
+            messages = self.history_manager.build_messages(chat_id, message_history, prompt, budget)
             message_history.append({'role': 'user', 'content': prompt})
+            print(f"Sending chat request to model '{model}' ({len(messages) - 1} of {len(message_history) - 1} earlier messages)...")
+            response = self._chat_request(model, messages, stream=True, stop_event=stop_event)
+            self.stream_response_to_chat(response, stop_event)
+            self.history_manager.compact_in_background(chat_id, message_history, model, budget)
         except Exception as e:
             self.after(0, self.append_to_chat, f"\nError in chat thread: {e}\n\n", "error_tag")
         finally:
+            self._end_generation(stop_event)
             self.stop_loading_event.set(); self.after(0, lambda: self.entry_box.config(state=tk.NORMAL))
 
-    def summarize_thread(self, doc_text, chat_id):
+    def _history_budget(self, model):
+        """Tokens of earlier conversation sent with a chat turn: history_token_budget, per model or as one number."""
+        budget = self.app_config.get("history_token_budget", 2048)
+        if isinstance(budget, dict):
+            budget = budget.get(model, budget.get(model.split(':')[0], budget.get("default", 2048)))
+        return min(int(budget), self._context_tokens() - SUMMARY_ANSWER_TOKENS - SUMMARY_PROMPT_TOKENS)
+
+    def _summarize_history(self, model, previous_summary, messages, max_tokens):
+        transcript = "\n\n".join(f"{message['role'].capitalize()}: {message['content']}" for message in messages)
+        prompt = f"Summary so far:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"
+        messages = [{'role': 'system', 'content': HISTORY_SUMMARY_SYSTEM_PROMPT}, {'role': 'user', 'content': prompt}]
+        return self._chat_request(model, messages, max_tokens=max_tokens)['message']['content'].strip()
+
+    def _context_tokens(self):
+        return max(2048, int(self.app_config.get("context_tokens", 8192)))
+
+    def _chat_request(self, model, messages, stream=False, max_tokens=None, stop_event=None):
+        """Sends a chat request to the chat model with the app-wide context size and keep_alive.
+
+        Every request uses the same num_ctx: Ollama reloads a model whose context
+        size changes, which would also throw away its prompt cache. Requests of a
+        generation (`stop_event` from _begin_generation) use its abortable client.
+        """
+        options = {"num_ctx": self._context_tokens()}
+        if max_tokens:
+            options["num_predict"] = max_tokens
+        with self.generation_lock:
+            client = self.active_generations.get(stop_event, self.ollama_client)
+        return client.chat(model=model, messages=messages, stream=stream, options=options,
+                           keep_alive=self.app_config.get("keep_alive", "30m"))
+
+    def on_chat_model_select(self, event=None):
+        model = self.model_var.get()
+        if model and model not in ("No models found", "Connection Failed"):
+            threading.Thread(target=self._preload_chat_model, args=(model,), daemon=True).start()
+
+    def _preload_chat_model(self, model):
+        """Loads the chat model into Ollama ahead of the first question, with the same options as later requests."""
+        try:
+            start_time = time.time()
+            self.ollama_client.generate(model=model, options={"num_ctx": self._context_tokens()},
+                                        keep_alive=self.app_config.get("keep_alive", "30m"))
+            print(f"Preloaded chat model '{model}' in {time.time() - start_time:.2f}s.")
+        except Exception as e:
+            print(f"Could not preload chat model '{model}': {e}")
+
+    def _get_section_notes_cache(self, doc_id):
+        key = self.doc_index_keys.get(doc_id, doc_id)
+        with self.section_notes_lock:
+            if key not in self.section_notes:
+                self.section_notes[key] = SectionNotesCache(self._get_index_file(key, ".notes.json"))
+            return self.section_notes[key]
+
+    def _chat_once(self, model, system_prompt, user_prompt, max_tokens, stop_event=None):
+        """Runs one chat request to completion and returns the reply.
+
+        The reply is streamed so that Stop can close the request mid-way.
+        """
+        if stop_event is not None and stop_event.is_set():
+            raise GenerationStopped() # Picked up by a pool worker after Stop
+        messages = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': user_prompt}]
+        response = self._chat_request(model, messages, stream=True, max_tokens=max_tokens, stop_event=stop_event)
+        reply = "".join(chunk['message']['content'] for chunk in self._iter_stream(response, stop_event))
+        if stop_event is not None and stop_event.is_set():
+            raise GenerationStopped()
+        return reply.strip()
+
+    def _run_summary_requests(self, cache, model, system_prompt, prompts, max_tokens, label, stop_event=None):
+        """Answers independent prompts from the notes cache or Ollama, at most summary_parallel_requests at a time.
+
+        Returns the replies in prompt order.
+        """
+        keys = [SectionNotesCache.entry_key(model, system_prompt, max_tokens, prompt) for prompt in prompts]
+        replies = [cache.get(key) for key in keys]
+        missing = [i for i, reply in enumerate(replies) if reply is None]
+        print(f"  [{label}] {len(prompts)} requests, {len(prompts) - len(missing)} answered from the notes cache.")
+        if not missing:
+            return replies
+        parallel = max(1, int(self.app_config.get("summary_parallel_requests", 2)))
+        with ThreadPoolExecutor(max_workers=min(parallel, len(missing))) as pool:
+            futures = {pool.submit(self._chat_once, model, system_prompt, prompts[i], max_tokens, stop_event): i for i in missing}
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    i = futures[future]
+                    replies[i] = future.result()
+                    cache.put(keys[i], replies[i])
+                    print(f"  [{label}] {done}/{len(missing)} done.")
+            except Exception:
+                for future in futures: future.cancel() # Requests still queued are never sent
+                raise
+        return replies
+
+    def _prepare_document_text(self, doc_id, model, stop_event=None):
+        """Returns (text, from_notes): what a summary or review of the document is written from.
+
+        A document that fits the context budget is passed whole. A longer one is
+        split into sections whose notes are taken concurrently and cached per
+        document, then neighbouring notes are merged until they fit in one request.
+        """
+        context_tokens = self._context_tokens()
+        answer_budget = context_tokens - SUMMARY_ANSWER_TOKENS - SUMMARY_PROMPT_TOKENS
+        section_budget = context_tokens - SUMMARY_NOTES_TOKENS - SUMMARY_PROMPT_TOKENS
+        sections = split_into_sections(self.pdf_text_db[doc_id], section_budget)
+        if len(sections) == 1 and estimate_tokens(sections[0]) <= answer_budget:
+            return sections[0], False
+
+        print(f"Reading '{doc_id}' in {len(sections)} sections...")
+        cache = self._get_section_notes_cache(doc_id)
+        notes = self._run_summary_requests(cache, model, SECTION_NOTES_SYSTEM_PROMPT, sections, SUMMARY_NOTES_TOKENS, "Sections", stop_event)
+
+        # Reduce: merge neighbouring notes. Every round leaves fewer notes, so this ends.
+        while sum(estimate_tokens(note) for note in notes) > answer_budget:
+            groups = pack_by_tokens(notes, section_budget)
+            if len(groups) == len(notes):
+                break # No two neighbouring notes fit in one request; send what there is
+            print(f"Merging {len(notes)} section notes into {len(groups)}...")
+            max_tokens = max(SUMMARY_NOTES_TOKENS, answer_budget // len(groups))
+            notes = self._run_summary_requests(cache, model, MERGE_NOTES_SYSTEM_PROMPT, ["\n\n".join(group) for group in groups],
+                                               max_tokens, "Merge", stop_event)
+        return "\n\n".join(notes), True
+
+    @staticmethod
+    def _document_message(request, doc_text, from_notes):
+        if from_notes:
+            request += " The document is too long to read at once, so it is given as notes taken section by section, in order"
+        return f"{request}:\n\n{doc_text}"
+
+    def _stream_document_task(self, doc_id, model, system_prompt, request, stop_event):
+        """Streams the final summary or review of doc_id, written from the whole text or from its section notes."""
+        doc_text, from_notes = self._prepare_document_text(doc_id, model, stop_event)
+        messages = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': self._document_message(request, doc_text, from_notes)}]
+        response = self._chat_request(model, messages, stream=True, stop_event=stop_event)
+        self.stream_response_to_chat(response, stop_event)
+
+    def summarize_thread(self, doc_id, chat_id):
+        stop_event = self._begin_generation()
         try:
             print("Executing summarize thread...")
             self.stop_loading_event.clear()
             threading.Thread(target=self.run_loading_animation, daemon=True).start()
+            model = self.model_var.get()
             
-            self.after(0, lambda: self.append_to_chat(f"{self.model_var.get().split(':')[0].capitalize()} (Summary):\n", "bot_name_tag"))
+            self.after(0, lambda: self.append_to_chat(f"{model.split(':')[0].capitalize()} (Summary):\n", "bot_name_tag"))
             
             prompt = "Provide a concise summary of the document."
             self.chat_sessions[chat_id].append({'role': 'user', 'content': prompt})
 
-            summary_prompt = f"Please provide a concise summary of the following document:\n\n{doc_text}"
-            messages = [{'role': 'system', 'content': SUMMARIZE_SYSTEM_PROMPT}, {'role': 'user', 'content': summary_prompt}]
-            response = self.ollama_client.chat(model=self.model_var.get(), messages=messages, stream=True)
-            self.stream_response_to_chat(response)
+            self._stream_document_task(doc_id, model, SUMMARIZE_SYSTEM_PROMPT, "Please provide a concise summary of the following document", stop_event)
 
+        except GenerationStopped:
+            self.after(0, self.append_to_chat, "[Stopped]\n\n", "thinking_tag")
         except Exception as e:
             self.after(0, self.append_to_chat, f"\nError during summarization: {e}\n\n", "error_tag")
         finally:
+            self._end_generation(stop_event)
             self.stop_loading_event.set()
             self.after(0, lambda: self.entry_box.config(state=tk.NORMAL))
 
@@ -610,9 +2778,7 @@ class ResearchApp(tk.Tk):
         if doc_id not in self.pdf_text_db or not self.pdf_text_db[doc_id]:
             return messagebox.showerror("Error", f"No text content found for '{doc_id}'. Was it processed correctly?")
 
-        full_text = "\n".join([chunk['text'] for chunk in self.pdf_text_db[doc_id]])
-
-        threading.Thread(target=self.summarize_thread, args=(full_text, self.current_chat_id), daemon=True).start()
+        threading.Thread(target=self.summarize_thread, args=(doc_id, self.current_chat_id), daemon=True).start()
 
     def on_summarize_button_click(self):
         selected_indices = self.doc_list_box.curselection()
@@ -621,8 +2787,8 @@ class ResearchApp(tk.Tk):
         
         doc_id = self.doc_list_box.get(selected_indices[0])
 
-        if self.processing_thread and self.processing_thread.is_alive():
-            return messagebox.showwarning("Busy", "Please wait for the current processing to finish.")
+        if self._is_ingesting(doc_id):
+            return messagebox.showwarning("Busy", f"'{doc_id}' is still being processed. Please wait for it to finish.")
         
         self._summarize_document_logic(doc_id)
 
@@ -633,44 +2799,124 @@ class ResearchApp(tk.Tk):
         
         doc_id = self.doc_list_box.get(selected_indices[0])
 
-        if self.processing_thread and self.processing_thread.is_alive():
-            return messagebox.showwarning("Busy", "Please wait for the current processing to finish.")
+        if self._is_ingesting(doc_id):
+            return messagebox.showwarning("Busy", f"'{doc_id}' is still being processed. Please wait for it to finish.")
 
         if doc_id not in self.pdf_text_db or not self.pdf_text_db[doc_id]:
             return messagebox.showerror("Error", f"No text content found for '{doc_id}'. Was it processed correctly?")
 
-        full_text = "\n".join([chunk['text'] for chunk in self.pdf_text_db[doc_id]])
-
         self._temp_review_doc_id = doc_id
-        self._temp_review_full_text = full_text
 
         self._show_reviewer_menu()
 
-    def review_thread(self, doc_text, chat_id, reviewer_role):
+    def review_thread(self, doc_id, chat_id, reviewer_role):
+        stop_event = self._begin_generation()
         try:
             print(f"Executing review thread with role: {reviewer_role}...")
             self.stop_loading_event.clear()
             threading.Thread(target=self.run_loading_animation, daemon=True).start()
+            model = self.model_var.get()
             
-            self.after(0, lambda: self.append_to_chat(f"{self.model_var.get().split(':')[0].capitalize()} (Review - {reviewer_role}):\n", "bot_name_tag"))
+            self.after(0, lambda: self.append_to_chat(f"{model.split(':')[0].capitalize()} (Review - {reviewer_role}):\n", "bot_name_tag"))
             
             prompt = f"Provide a critical review of the document from the perspective of a {reviewer_role}."
             self.chat_sessions[chat_id].append({'role': 'user', 'content': prompt})
 
             reviewer_prompt = ALL_REVIEWERS.get(reviewer_role, REVIEW_SYSTEM_PROMPT)
-            review_prompt = f"Please provide a critical review of the following document:\n\n{doc_text}"
-            messages = [{'role': 'system', 'content': reviewer_prompt}, {'role': 'user', 'content': review_prompt}]
-            response = self.ollama_client.chat(model=self.model_var.get(), messages=messages, stream=True)
-            self.stream_response_to_chat(response)
+            self._stream_document_task(doc_id, model, reviewer_prompt, "Please provide a critical review of the following document", stop_event)
 
+        except GenerationStopped:
+            self.after(0, self.append_to_chat, "[Stopped]\n\n", "thinking_tag")
         except Exception as e:
             self.after(0, self.append_to_chat, f"\nError during review: {e}\n\n", "error_tag")
         finally:
+            self._end_generation(stop_event)
             self.stop_loading_event.set()
             self.after(0, lambda: self.entry_box.config(state=tk.NORMAL))
 
 
 
+    def panel_review_thread(self, doc_id, chat_id, roles, window):
+        """Runs the selected expert reviews concurrently, each into its own pane, then has the Chief Editor merge them in the chat."""
+        stop_event = self._begin_generation()
+        try:
+            print(f"Executing panel review with roles: {', '.join(roles)}...")
+            self.stop_loading_event.clear()
+            threading.Thread(target=self.run_loading_animation, daemon=True).start()
+            model = self.model_var.get()
+
+            self.after(0, lambda: self.append_to_chat(f"{model.split(':')[0].capitalize()} (Panel Review - Chief Editor):\n", "bot_name_tag"))
+
+            prompt = f"Provide a panel review of the document by the {', '.join(roles)} reviewers, merged by the Chief Editor."
+            self.chat_sessions[chat_id].append({'role': 'user', 'content': prompt})
+
+            self.after(0, window.set_status, "Preparing the document...")
+            doc_text, from_notes = self._prepare_document_text(doc_id, model, stop_event)
+            # Every reviewer gets the same leading messages, so only the role instructions at the end differ.
+            shared_messages = [{'role': 'system', 'content': REVIEW_SYSTEM_PROMPT},
+                               {'role': 'user', 'content': self._document_message("Here is the document to review", doc_text, from_notes)}]
+            # Cap each review so that all of them fit in the Chief Editor's context.
+            review_budget = self._context_tokens() - SUMMARY_ANSWER_TOKENS - SUMMARY_PROMPT_TOKENS
+            max_tokens = max(SUMMARY_NOTES_TOKENS, min(SUMMARY_ANSWER_TOKENS, review_budget // len(roles)))
+
+            self.after(0, window.set_status, f"{len(roles)} reviewers are reading the document...")
+            start_time, reviews = time.time(), {}
+            with ThreadPoolExecutor(max_workers=len(roles)) as pool:
+                futures = {pool.submit(self._panel_review_role, model, shared_messages, role, max_tokens, window, stop_event): role for role in roles}
+                for future in as_completed(futures):
+                    role = futures[future]
+                    try:
+                        reviews[role] = future.result()
+                        self.after(0, window.set_role_status, role, "done")
+                        print(f"  - {role} review finished after {time.time() - start_time:.1f}s.")
+                    except GenerationStopped:
+                        self.after(0, window.set_role_status, role, "stopped")
+                    except Exception as e:
+                        print(f"  - {role} review failed: {e}")
+                        self.after(0, window.set_role_status, role, "failed")
+                        self.after(0, window.append, role, f"\n\nError: {e}")
+            if stop_event.is_set():
+                raise GenerationStopped()
+            if not reviews:
+                raise RuntimeError("none of the reviewers could finish.")
+
+            self.after(0, window.set_status, "The Chief Editor is writing the final review in the chat window...")
+            reviews_text = "\n\n".join(f"### {role}\n{reviews[role]}" for role in roles if role in reviews)
+            messages = [{'role': 'system', 'content': ALL_REVIEWERS["Chief Editor"]},
+                        {'role': 'user', 'content': f"User request: {prompt}\n\nReviews of '{doc_id}' by the expert panel:\n\n{reviews_text}"}]
+            response = self._chat_request(model, messages, stream=True, stop_event=stop_event)
+            self.stream_response_to_chat(response, stop_event)
+            self.after(0, window.set_status, f"Finished in {time.time() - start_time:.0f}s. The final review is in the chat window.")
+
+        except GenerationStopped:
+            self.after(0, window.set_status, "Stopped.")
+            self.after(0, self.append_to_chat, "[Stopped]\n\n", "thinking_tag")
+        except Exception as e:
+            self.after(0, self.append_to_chat, f"\nError during panel review: {e}\n\n", "error_tag")
+        finally:
+            self._end_generation(stop_event)
+            self.stop_loading_event.set()
+            self.after(0, lambda: self.entry_box.config(state=tk.NORMAL))
+
+    def _panel_review_role(self, model, shared_messages, role, max_tokens, window, stop_event):
+        """Streams one expert's review into its pane and returns the full text."""
+        messages = shared_messages + [{'role': 'user', 'content': f"{ALL_REVIEWERS[role]}\nPlease provide a critical review of the document from this perspective."}]
+        response = self._chat_request(model, messages, stream=True, max_tokens=max_tokens, stop_event=stop_event)
+        full_review, token_batch, last_update_time = "", [], time.time()
+        first_token_received = False
+        for chunk in self._iter_stream(response, stop_event):
+            if not first_token_received:
+                self.after(0, window.set_role_status, role, "writing"); first_token_received = True
+            token = chunk['message']['content']
+            full_review += token
+            token_batch.append(token)
+            if time.time() - last_update_time > 0.05:
+                self.after(0, window.append, role, "".join(token_batch)); token_batch.clear(); last_update_time = time.time()
+        if token_batch: self.after(0, window.append, role, "".join(token_batch))
+        if stop_event.is_set():
+            raise GenerationStopped()
+        return full_review
+
     def on_paraphrase_button_click(self):
         if not self.current_chat_id or not self.chat_sessions.get(self.current_chat_id):
             return messagebox.showinfo("No Chat", "Please select a chat with a previous response to paraphrase.")
@@ -691,6 +2937,7 @@ class ResearchApp(tk.Tk):
         threading.Thread(target=self.paraphrase_thread, args=(last_bot_response, self.current_chat_id), daemon=True).start()
 
     def paraphrase_thread(self, text_to_paraphrase, chat_id):
+        stop_event = self._begin_generation()
         try:
             print("Executing paraphrase thread...")
             self.stop_loading_event.clear()
@@ -702,12 +2949,13 @@ class ResearchApp(tk.Tk):
             self.chat_sessions[chat_id].append({'role': 'user', 'content': "Paraphrase the last response."})
 
             messages = [{'role': 'system', 'content': "You are a helpful AI assistant. Your task is to paraphrase the given text, rephrasing it in a different style or tone while preserving the original meaning."}, {'role': 'user', 'content': prompt}]
-            response = self.ollama_client.chat(model=self.model_var.get(), messages=messages, stream=True)
-            self.stream_response_to_chat(response)
+            response = self._chat_request(self.model_var.get(), messages, stream=True, stop_event=stop_event)
+            self.stream_response_to_chat(response, stop_event)
 
         except Exception as e:
             self.after(0, self.append_to_chat, f"\nError during paraphrasing: {e}\n\n", "error_tag")
         finally:
+            self._end_generation(stop_event)
             self.stop_loading_event.set()
             self.after(0, lambda: self.entry_box.config(state=tk.NORMAL))
 
@@ -719,30 +2967,46 @@ class ResearchApp(tk.Tk):
         if not new_model or new_model_name == self.embedding_model_name:
             return
 
+        if self.ingest_jobs:
+            messagebox.showwarning("Busy", "Documents are still being ingested with the current embedding model. Please wait for the queue to finish.")
+            current = next((m for m in self.embed_selector['values'] if m.split(':')[0] == self.embedding_model_name), "")
+            self.embed_model_var.set(current)
+            return
+
         print(f"User selected new embedding model: {new_model_name}")
 
-        # If a document is already loaded and processed, its vectors are now invalid.
-        if self.pdf_text_db:
-             messagebox.showwarning("Model Changed", 
-                                  "You have changed the embedding model.\n\n"
-                                  "The vector data for all loaded documents is now invalid. "
-                                  "Please remove and reload your documents to use the new model.")
-             # For safety, clear all vector caches and in-memory text databases
-             for doc_id in list(self.pdf_text_db.keys()):
-                 self.remove_vector_cache(doc_id)
-             self.pdf_text_db.clear()
-             self.doc_list_box.delete(0, tk.END)
-             self.start_new_chat()
+        # Index keys include the embedding model, so the old model's files stay on disk for switching back.
+        # Only the in-memory tables are dropped; loaded documents are reopened under the new model.
+        loaded_docs = [doc_id for doc_id in self.pdf_text_db if doc_id in self.doc_paths]
+        self.pdf_text_db.clear()
+        self.doc_index_keys.clear()
+        self.ivf_lists.clear()
+        self.lexical_indexes.clear()
         
         self.embedding_model_name = new_model_name
+        self.ivf_codebook = None # Centroids are specific to an embedding model
+        self.index_handles.clear()
         self.app_config["embedding_model_name"] = new_model_name
         self._save_config(self.app_config)
         print(f"Saved new embedding model '{new_model_name}' to config.")
 
+        if loaded_docs:
+            for doc_id in loaded_docs:
+                self._queue_ingest_job(doc_id, self.doc_paths[doc_id], interactive=False)
+            print(f"Reopening {len(loaded_docs)} document(s) with '{new_model_name}'.")
+            self._ensure_ingest_workers()
+            messagebox.showinfo("Model Changed",
+                                f"Reopening {len(loaded_docs)} loaded document(s) with '{new_model_name}'.\n\n"
+                                "Documents indexed with this model before load from the cache; the others are embedded again in the background.")
+
     def _embed_chunk_task(self, chunk_text):
         """Worker task for thread pool to embed and normalize a text chunk."""
         import numpy as np
         
+        cached_vector = self.embedding_cache.get_many(self.embedding_model_name, [chunk_text])[0]
+        if cached_vector is not None:
+            return cached_vector.astype(np.float16)
+
         # --- DEBUG PRINTS ADDED ---
         print(f"DEBUG: Thread started. Text length: {len(chunk_text)}")
         try:
@@ -758,12 +3022,48 @@ class ResearchApp(tk.Tk):
             if norm > 0:
                 vector /= norm
             
+            self.embedding_cache.put_many(self.embedding_model_name, [chunk_text], vector[np.newaxis])
             return vector.astype(np.float16)
             
         except Exception as e:
             print(f"DEBUG: Error inside thread: {e}")
             raise e
 
+    def _embed_batch_task(self, texts):
+        """Embeds a batch of text chunks with a single request and returns normalized float16 rows."""
+        cached_vectors = self.embedding_cache.get_many(self.embedding_model_name, texts)
+        missing = [i for i, vector in enumerate(cached_vectors) if vector is None]
+        if not missing:
+            return np.vstack(cached_vectors).astype(np.float16)
+
+        missing_texts = [texts[i] for i in missing]
+        try:
+            response = self.ollama_client.embed(model=self.embedding_model_name, input=missing_texts)
+            vectors = np.asarray(response['embeddings'], dtype=np.float32)
+        except ollama.ResponseError as e:
+            if e.status_code != 404:
+                raise
+            # Older Ollama servers have no multi-input /api/embed endpoint; embed one chunk at a time.
+            print("  - Server does not support batched embeddings. Falling back to per-chunk requests.")
+            vectors = np.vstack([self._embed_chunk_task(text) for text in missing_texts]).astype(np.float32)
+        else:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            np.divide(vectors, norms, out=vectors, where=norms > 0)
+            self.embedding_cache.put_many(self.embedding_model_name, missing_texts, vectors)
+
+        for i, vector in zip(missing, vectors):
+            cached_vectors[i] = vector
+        return np.vstack(cached_vectors).astype(np.float16)
+
+    def _embed_query(self, prompt):
+        """Embeds a user query, reusing the cached vector when the same question was asked before."""
+        query_vector = self.embedding_cache.get_many(self.embedding_model_name, [prompt], kind="query")[0]
+        if query_vector is None:
+            query_vector = np.array(self.ollama_client.embeddings(model=self.embedding_model_name, prompt=prompt)['embedding'], dtype=np.float32)
+            self.embedding_cache.put_many(self.embedding_model_name, [prompt], query_vector[np.newaxis], kind="query")
+        print(f"  - {self.embedding_cache.describe()}")
+        return query_vector
+
     def populate_models(self):
         print("\n--- Populating Models ---")
         try:
@@ -855,12 +3155,13 @@ class ResearchApp(tk.Tk):
                 self.embed_model_var.set(selected_embedding_model)
                 self.embedding_model_name = selected_embedding_model.split(':')[0]
                 self.embedding_model_available = True
-                self.load_pdf_button.config(state=tk.NORMAL)
+                self.load_pdf_button.config(state=tk.NORMAL); self.load_folder_button.config(state=tk.NORMAL)
                 print(f"   - SUCCESS: Auto-selected embedding model: '{self.embedding_model_name}'")
+                self._resume_interrupted_ingests()
             else:
                 self.embedding_model_available = False
                 self.embed_model_var.set("No models found")
-                self.load_pdf_button.config(state=tk.DISABLED)
+                self.load_pdf_button.config(state=tk.DISABLED); self.load_folder_button.config(state=tk.DISABLED)
                 print(f"   - WARNING: No embedding models were found. Document features will be disabled.")
 
             # --- Select Active Chat Model ---
@@ -869,6 +3170,7 @@ class ResearchApp(tk.Tk):
                 new_selection = chat_models[0] if chat_models else ""
                 self.model_var.set(new_selection)
                 print(f"7. Current model selection ('{current_selection}') is invalid. Setting to: '{new_selection}'")
+                self.on_chat_model_select()
 
             if not self.current_chat_id:
                 print("8. No current chat session. Starting a new one.")
@@ -880,57 +3182,301 @@ class ResearchApp(tk.Tk):
             print(f"ERROR: {e}")
             self.status_light.config(foreground=Style.ERROR); self.status_label.config(text="Ollama Not Found")
             self.model_selector['values'] = ["Connection Failed"]; self.model_var.set("Connection Failed")
-            self.load_pdf_button.config(state=tk.DISABLED) # Also disable on connection failure
+            self.load_pdf_button.config(state=tk.DISABLED); self.load_folder_button.config(state=tk.DISABLED) # Also disable on connection failure
             if self.ollama_client:
                 print("Retrying in 5 seconds...")
                 self.after(5000, lambda: self.populate_models())
 
     def update_system_stats(self):
-        self.stats_label.config(text=f"RAM: {psutil.virtual_memory().percent}%  |  {self.last_tok_per_sec}")
+        stats_text = f"RAM: {psutil.virtual_memory().percent}%  |  {self.last_tok_per_sec}"
+        if self.ingest_jobs: stats_text += f"  |  Ingest {self.embed_controller.describe()}"
+        self.stats_label.config(text=stats_text)
+        self.ingest_status_label.config(text=self._describe_ingest_queue())
         self.after(1000, lambda: self.update_system_stats())
 
     def load_new_pdf(self):
-        if self.processing_thread and self.processing_thread.is_alive(): return messagebox.showwarning("Busy", "Please wait...")
         if not self.embedding_model_available: return messagebox.showerror("Model Error", f"{self.embedding_model_name} not found.")
         
-        file_path = filedialog.askopenfilename(title="Select PDF", filetypes=[("PDF Documents", "*.pdf")])
-        if not file_path:
+        file_paths = filedialog.askopenfilenames(title="Select PDF(s)", filetypes=[("PDF Documents", "*.pdf")])
+        if not file_paths:
             print("User cancelled PDF selection.")
             return
 
-        pdf_name = os.path.basename(file_path)
-        print(f"Loading document: {pdf_name}")
-        if pdf_name in self.chat_sessions: return messagebox.showinfo("Already Loaded", f"'{pdf_name}' is already loaded.")
+        if len(file_paths) == 1:
+            pdf_name = os.path.basename(file_paths[0])
+            if pdf_name in self.chat_sessions: return messagebox.showinfo("Already Loaded", f"'{pdf_name}' is already loaded.")
+            self.enqueue_pdfs(file_paths, interactive=True)
+        else:
+            self.enqueue_pdfs(file_paths, interactive=False)
+
+    def load_pdf_folder(self):
+        if not self.embedding_model_available: return messagebox.showerror("Model Error", f"{self.embedding_model_name} not found.")
+
+        folder = filedialog.askdirectory(title="Select a folder of PDFs")
+        if not folder:
+            print("User cancelled folder selection.")
+            return
 
+        file_paths = []
+        for root, _, files in os.walk(folder):
+            file_paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(".pdf"))
+        if not file_paths:
+            return messagebox.showinfo("No PDFs", f"No PDF files were found in '{folder}'.")
+        print(f"Found {len(file_paths)} PDF(s) in '{folder}'.")
+        self.enqueue_pdfs(file_paths, interactive=False)
+
+    def enqueue_pdfs(self, file_paths, interactive):
+        """Registers documents in the sidebar and queues them for the background ingest workers.
+
+        Interactive (single document) jobs select the document and report errors in a
+        dialog. Bulk jobs run unattended: failures are collected and reported once
+        the queue has drained.
+        """
+        queued = 0
+        for file_path in file_paths:
+            pdf_name = os.path.basename(file_path)
+            if pdf_name in self.chat_sessions:
+                print(f"  - Skipping '{pdf_name}': a document with this name is already loaded.")
+                continue
+
+            self.chat_sessions[pdf_name] = []
+            self._queue_ingest_job(pdf_name, file_path, interactive)
+            self.doc_list_box.insert(tk.END, pdf_name)
+            queued += 1
+
+        if not queued:
+            return
+        print(f"Queued {queued} document(s) for ingest.")
+        if interactive:
+            self.doc_list_box.selection_clear(0, tk.END)
+            self.doc_list_box.selection_set(tk.END)
+            self.on_history_select(None, 'doc')
+        self._ensure_ingest_workers()
+
+    def _queue_ingest_job(self, pdf_name, file_path, interactive):
+        self.pdf_text_db[pdf_name] = ChunkTable()
+        self.doc_paths[pdf_name] = file_path
+        job = {"path": file_path, "interactive": interactive, "started": False, "progress": "Queued", "cancel": threading.Event()}
+        with self.ingest_lock:
+            self.ingest_jobs[pdf_name] = job
+        self.ingest_queue.put((pdf_name, job))
+
+    def _ensure_ingest_workers(self):
+        """Starts the ingest worker threads on first use. Each one processes one document at a time."""
+        count = max(1, int(self.app_config.get("ingest_parallel_documents", 2)))
+        while len(self.ingest_workers) < count:
+            worker = threading.Thread(target=self._ingest_worker, daemon=True)
+            worker.start()
+            self.ingest_workers.append(worker)
+
+    def _ingest_worker(self):
+        while True:
+            pdf_name, job = self.ingest_queue.get()
+            with self.ingest_lock:
+                if self.ingest_jobs.get(pdf_name) is not job:
+                    continue # Removed by the user while it was queued
+                job["started"] = True
+            try:
+                self._run_ingest_job(pdf_name, job)
+            finally:
+                with self.ingest_lock:
+                    self.ingest_jobs.pop(pdf_name, None)
+                    drained = not self.ingest_jobs
+                if drained:
+                    self.after(0, lambda: self._report_bulk_ingest())
+
+    def _run_ingest_job(self, pdf_name, job):
+        file_path, interactive = job["path"], job["interactive"]
+        print(f"Loading document: {pdf_name}")
+        self._set_ingest_progress(pdf_name, "Checking")
         try:
             doc = fitz.open(file_path)
             if doc.is_encrypted or doc.page_count == 0: raise ValueError("PDF is encrypted or empty.")
             doc.close()
+            file_hash = compute_file_hash(file_path)
         except Exception as e:
-            return messagebox.showerror("PDF Error", f"Cannot read PDF: {e}")
-
-        self.chat_sessions[pdf_name] = []
-        self.pdf_text_db[pdf_name] = []
-        self.doc_list_box.insert(tk.END, pdf_name)
-        self.doc_list_box.selection_clear(0, tk.END)
-        self.doc_list_box.selection_set(tk.END)
-        self.on_history_select(None, 'doc')
-        
-        self.processing_thread = threading.Thread(target=self.process_and_embed_pdf, args=(file_path, pdf_name), daemon=True)
-        self.processing_thread.start()
+            self._on_ingest_failed(pdf_name, f"Cannot read PDF: {e}", interactive)
+            return
+
+        index_key = self._get_index_key(file_hash)
+        self.doc_index_keys[pdf_name] = index_key
+        print(f"  - Index key for '{pdf_name}': {index_key}")
+
+        # Identical files share one index file, so a second copy waits and then loads it from the cache.
+        with self.ingest_lock:
+            while index_key in self.ingest_active_keys:
+                self.ingest_key_released.wait()
+            self.ingest_active_keys.add(index_key)
+        try:
+            # A document with the same content, embedding model and chunking was processed before.
+            if self._load_persisted_index(pdf_name):
+                self._on_ingest_succeeded(pdf_name, interactive, "from the index cache")
+                return
 
-    def process_and_embed_pdf(self, pdf_path, pdf_id):
+            self.process_and_embed_pdf(file_path, pdf_name, interactive)
+        finally:
+            with self.ingest_lock:
+                self.ingest_active_keys.discard(index_key)
+                self.ingest_key_released.notify_all()
+
+    def _set_ingest_progress(self, doc_id, text):
+        job = self.ingest_jobs.get(doc_id)
+        if job is not None:
+            job["progress"] = text
+
+    def _is_ingesting(self, doc_id):
+        return doc_id in self.ingest_jobs
+
+    def _describe_ingest_queue(self):
+        with self.ingest_lock:
+            jobs = list(self.ingest_jobs.items())
+        if not jobs:
+            return ""
+        running = [(doc_id, job["progress"]) for doc_id, job in jobs if job["started"]]
+        lines = [f"Ingest: {len(running)} running, {len(jobs) - len(running)} queued"]
+        lines += [f"{doc_id}: {progress}" for doc_id, progress in running]
+        return "\n".join(lines)
+
+    def _on_ingest_succeeded(self, doc_id, interactive, how=""):
+        try:
+            self._update_ann_index(doc_id)
+        except Exception as e:
+            print(f"  - Could not update the approximate search index: {e}")
+        print(f"--- '{doc_id}' is ready{' (' + how + ')' if how else ''} ---")
+        if interactive:
+            message = f"Loaded '{doc_id}' {how}. Ready to chat.\n\n" if how else f"Ready to chat with '{doc_id}'.\n\n"
+            self.after(0, lambda: self.append_to_chat(message, "thinking_tag"))
+        else:
+            with self.ingest_lock:
+                self.ingest_results["loaded"] += 1
+
+    def _on_ingest_failed(self, doc_id, error, interactive, keep_index=False):
+        print(f"--- Error processing PDF '{doc_id}': {error} ---", file=sys.stderr)
+        details = f"{error}\n\nThe embedded part was kept; loading the PDF again resumes from there." if keep_index else str(error)
+        if interactive:
+            self.after(0, lambda: messagebox.showerror("Processing Error", f"Failed to process '{doc_id}'.\n\nDetails: {details}"))
+        else:
+            with self.ingest_lock:
+                self.ingest_results["failed"].append((doc_id, str(error)))
+        self.after(0, lambda: self.remove_document_data(doc_id, keep_index=keep_index))
+
+    def cancel_ingest(self):
+        """Cancels the selected document's ingest, or every queued and running ingest. Embedded rows are kept."""
+        selected_indices = self.doc_list_box.curselection()
+        selected = self.doc_list_box.get(selected_indices[0]) if selected_indices else None
+        if selected in self.ingest_jobs:
+            doc_ids = [selected]
+        elif self.ingest_jobs:
+            if not messagebox.askyesno("Cancel Ingest", f"Cancel all {len(self.ingest_jobs)} queued and running ingests?\n\n"
+                                       "Chunks embedded so far are kept, and loading a PDF again resumes from there."):
+                return
+            doc_ids = list(self.ingest_jobs)
+        else:
+            return messagebox.showinfo("Cancel Ingest", "No documents are being processed.")
+
+        for doc_id in doc_ids:
+            with self.ingest_lock:
+                job = self.ingest_jobs.get(doc_id)
+                if job is None: continue
+                job["cancel"].set()
+                if not job["started"]:
+                    del self.ingest_jobs[doc_id] # The worker skips it
+            if not job["started"]:
+                print(f"Removed '{doc_id}' from the ingest queue.")
+                self._mark_checkpoints_cancelled(job["path"])
+                self.remove_document_data(doc_id, keep_index=True)
+            else:
+                job["progress"] = "Cancelling..."
+        # No worker finishes a job if the queue was emptied by removing queued jobs alone.
+        self._report_bulk_ingest()
+
+    def _mark_checkpoints_cancelled(self, file_path):
+        """Stops an interrupted ingest of this file from being resumed automatically at the next start."""
+        source_path = os.path.abspath(file_path)
+        for name in os.listdir(self.vector_cache_dir):
+            path = os.path.join(self.vector_cache_dir, name)
+            data = IngestCheckpoint.load(path) if name.endswith(".ckpt.json") else None
+            if data and data.get("source_path") == source_path and not data.get("cancelled"):
+                data["cancelled"] = True
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+
+    def _resume_interrupted_ingests(self):
+        """Queues documents whose ingest was interrupted by a crash or by closing the app."""
+        if self.checked_for_interrupted_ingests:
+            return
+        self.checked_for_interrupted_ingests = True
+        file_paths = []
+        for name in sorted(os.listdir(self.vector_cache_dir)):
+            if not name.endswith(".ckpt.json"):
+                continue
+            data = IngestCheckpoint.load(os.path.join(self.vector_cache_dir, name))
+            if not data or data.get("cancelled") or data.get("embedding_model") != self.embedding_model_name:
+                continue
+            if not os.path.exists(data.get("source_path", "")):
+                print(f"  - Cannot resume '{data.get('source_name')}': '{data.get('source_path')}' no longer exists.")
+                continue
+            file_paths.append(data["source_path"])
+        if file_paths:
+            print(f"Resuming {len(file_paths)} interrupted ingest(s)...")
+            self.enqueue_pdfs(file_paths, interactive=False)
+
+    def _report_bulk_ingest(self):
+        """Reports the outcome of queued bulk ingests once every job has finished."""
+        with self.ingest_lock:
+            if self.ingest_jobs:
+                return
+            loaded, failed = self.ingest_results["loaded"], self.ingest_results["failed"]
+            self.ingest_results = {"loaded": 0, "failed": []}
+        if not loaded and not failed:
+            return
+        print(f"--- Bulk ingest finished: {loaded} loaded, {len(failed)} failed ---")
+        if self.current_chat_id:
+            self.append_to_chat(f"Bulk ingest finished: {loaded} document(s) ready, {len(failed)} failed.\n\n", "thinking_tag")
+        if failed:
+            details = "\n".join(f"- {doc_id}: {error}" for doc_id, error in failed[:20])
+            if len(failed) > 20: details += f"\n... and {len(failed) - 20} more (see the console)."
+            messagebox.showwarning("Bulk Ingest", f"{len(failed)} document(s) could not be processed:\n\n{details}")
+
+    def _get_parse_pool(self):
+        """Returns the app-wide PDF parse pool, starting its worker processes on first use."""
+        with self.parse_pool_lock:
+            if self.parse_pool is None:
+                self.parse_pool_size = cpu_count()
+                print(f"Starting PDF parse pool with {self.parse_pool_size} worker process(es)...")
+                self.parse_pool = Pool(processes=self.parse_pool_size, initializer=init_parse_worker)
+            return self.parse_pool
+
+    def _ingesting_paths(self):
+        """Paths of the documents being ingested; parse workers close any other document they still hold."""
+        with self.ingest_lock:
+            return tuple(job["path"] for job in self.ingest_jobs.values() if job["started"])
+
+    def _shutdown_parse_pool(self):
+        with self.parse_pool_lock:
+            if self.parse_pool is not None:
+                print("Shutting down PDF parse pool...")
+                self.parse_pool.terminate()
+                self.parse_pool.join()
+                self.parse_pool = None
+
+    def process_and_embed_pdf(self, pdf_path, pdf_id, interactive=True):
+        writer = None
+        previous = None
+        checkpoint, resume_rows = None, 0
+        ingest_start = time.time()
+        job = self.ingest_jobs.get(pdf_id)
+        cancel_event = job["cancel"] if job is not None else threading.Event()
         try:
             print(f"--- Starting PDF Processing for '{pdf_id}' ---")
-            self.after(0, lambda: self.load_pdf_button.config(state=tk.DISABLED))
             
             # --- Stage 1: Parallel Text Extraction and Chunking ---
+            # The parse pool is shared with the other documents being ingested.
             print(f"[Stage 1/3] Parsing text from '{os.path.basename(pdf_path)}'...")
-            self.after(0, lambda: self.status_label.config(text=f"Parsing '{pdf_id}'...", foreground=Style.ACCENT))
+            self._set_ingest_progress(pdf_id, "Parsing")
             try:
-                doc = fitz.open(pdf_path)
-                page_count = doc.page_count
-                doc.close()
+                page_fingerprints = compute_page_fingerprints(pdf_path)
+                page_count = len(page_fingerprints)
                 print(f"  - PDF has {page_count} pages.")
             except Exception as e:
                 raise ValueError(f"Could not open or read PDF: {e}")
@@ -938,99 +3484,247 @@ class ResearchApp(tk.Tk):
             if page_count == 0:
                 raise ValueError("PDF is empty.")
 
-            num_processes_parse = min(cpu_count(), page_count) if page_count > 0 else 1
-            page_batches = np.array_split(range(page_count), num_processes_parse)
-            parse_args = [(pdf_path, batch.tolist()) for batch in page_batches if batch.size > 0]
-            
-            chunks = []
-            with Pool(processes=num_processes_parse) as pool:
-                processed_pages = 0
-                print(f"  - Starting text extraction with {len(parse_args)} worker process(es)...")
-                for i, result_batch in enumerate(pool.imap(parse_pages_worker, parse_args)):
-                    if isinstance(result_batch, Exception):
-                        raise ValueError(f"Parsing batch {i+1} failed in worker. Error: {result_batch}")
-                    chunks.extend(result_batch)
-                    processed_pages += len(parse_args[i][1])
-                    print(f"  - Processed batch {i+1}/{len(parse_args)}, pages done: {processed_pages}/{page_count}")
-                    self.after(0, lambda p=processed_pages: self.status_label.config(text=f"Parsing page: {p}/{page_count}"))
-            print(f"  - Text extraction complete. Found {len(chunks)} text chunks.")
-
-            if not chunks:
-                raise ValueError("Could not extract any text from PDF.")
-            
-            self.pdf_text_db[pdf_id] = chunks
-            total_chunks = len(chunks)
-
-            # --- Stage 2: Threaded Embedding Generation ---
-            print(f"[Stage 2/3] Generating embeddings for {total_chunks} chunks...")
-            self.after(0, lambda: self.status_label.config(text=f"Embedding 0/{total_chunks}", foreground=Style.ACCENT))
-
-            worker_args = [chunk['text'] for chunk in chunks]
-            # Set concurrency to 1 to prevent overloading the local Ollama server.
-            safe_concurrency = 1
-            num_threads = 1
-
-            results = [None] * total_chunks # Pre-allocate list to store results in order
-            
-            with ThreadPoolExecutor(max_workers=num_threads) as executor:
-                print(f"  - Starting embedding generation with {num_threads} worker thread(s)...")
-                # Create a map of future to its index to reorder results
-                future_to_index = {executor.submit(self._embed_chunk_task, text): i for i, text in enumerate(worker_args)}
-
-                processed_count = 0
-                for future in as_completed(future_to_index):
-                    index = future_to_index[future]
-                    try:
-                        result = future.result()
-                        results[index] = result
-                    except Exception as e:
-                        # An exception was raised in the worker
-                        raise ValueError(f"Embedding chunk {index + 1} failed in worker. Error: {e}")
-
-                    processed_count += 1
-                    if (processed_count % 10 == 0) or (processed_count == total_chunks):
-                        print(f"  - Embedded chunk {processed_count}/{total_chunks}")
-                        self.after(0, lambda p=processed_count: self.status_label.config(text=f"Embedding: {p}/{total_chunks}"))
-
-            print("  - Embedding generation complete.")
+            pool = self._get_parse_pool()
+            num_processes_parse = self.parse_pool_size
+            # Small page tasks let parsed text reach the embedder while later pages are still being read.
+            parse_args = [(pdf_path, list(range(start, min(start + PARSE_TASK_PAGES, page_count))), self.chunker)
+                          for start in range(0, page_count, PARSE_TASK_PAGES)]
+
+            # An edited version of a document loaded before: unchanged pages reuse their stored text and vectors.
+            known_results = {}
+            previous = self._find_previous_version(pdf_id)
+            if previous is not None:
+                for i, (_, page_numbers, _) in enumerate(parse_args):
+                    stored = [previous.page_units(page_fingerprints[n], n) for n in page_numbers]
+                    if all(units is not None for units in stored):
+                        known_results[i] = [unit for units in stored for unit in units]
+                print(f"  - Found an earlier version of '{pdf_id}': {previous.reused_pages}/{page_count} pages unchanged.")
+            page_units = {} # page number -> [text, tokens, block_end] of each unit, saved as chunk references for the next reload
+            # Units from the parse workers are packed in page order, so chunks can cross page batches.
+            packer = self.chunker.packer()
+            chunk_table = ChunkTable()
+            boilerplate = BoilerplateFilter() if self.remove_boilerplate else None
+            deduplicator = ChunkDeduplicator(chunk_table.also_pages) if self.deduplicate_chunks else None
+            print(f"  - Chunking with '{self._get_chunking_signature()}'.")
+
+            def clean_and_pack(units, is_last):
+                """Runs the boilerplate and duplicate filters between the parse workers and the embedder."""
+                if boilerplate is not None:
+                    units = boilerplate.add(units) + (boilerplate.finish() if is_last else [])
+                chunks = packer.add(units) + (packer.finish() if is_last else [])
+                return deduplicator.filter(chunks) if deduplicator is not None else chunks
+
+            # --- Stage 2: Batched Embedding Generation (overlaps with parsing) ---
+            # The number of concurrent requests is adapted to the local Ollama server's response times
+            # and shared by all documents being ingested.
+            batch_tuner = EmbeddingBatchTuner(self.app_config.get("embedding_batch_size", 0))
+            print(f"[Stage 2/3] Embedding chunks as pages arrive ({batch_tuner.describe()})...")
+
+            # --- Stage 3: Vector Saving (background writer thread) ---
+            # Chunks become searchable as soon as their vectors are on disk.
+            self.pdf_text_db[pdf_id] = chunk_table
+            vector_path = self._get_partial_vector_path(pdf_id)
+            resume_rows, resume_dim, resume_digest = self._find_checkpoint(pdf_id)
+            checkpoint = IngestCheckpoint(self._get_checkpoint_path(pdf_id), {
+                "source_path": os.path.abspath(pdf_path), "source_name": os.path.basename(pdf_path),
+                "embedding_model": self.embedding_model_name, "chunker": self._get_chunking_signature()})
+
+            def on_batch_written(chunks):
+                chunk_table.extend(chunks)
+                checkpoint.on_rows_written(chunks, writer)
+
+            writer = VectorStoreWriter(vector_path, on_batch_written, self._vector_header_fields(), resume_rows=resume_rows, dim=resume_dim)
+            writer.start()
+            if resume_rows:
+                print(f"[Stage 3/3] Resuming '{vector_path}' after {resume_rows} committed rows.")
+            else:
+                print(f"[Stage 3/3] Appending vectors to '{vector_path}' as they are embedded.")
+
+            pending_chunks = []
+            embeds_in_flight = deque() # [chunks, future, attempts], in chunk order
+            parsed_pages, embedded_count, start_time, first_chunk_time = 0, 0, time.time(), None
+            next_row, replayed_digest = 0, hashlib.sha1()
+
+            def timed_embed(texts):
+                """Returns the batch's vectors, how long embedding took, and how many texts were embedded."""
+                batch_start = time.time()
+                if previous is None:
+                    return self._embed_batch_task(texts), time.time() - batch_start, len(texts)
+                vectors = previous.lookup_vectors(texts)
+                missing = [i for i, vector in enumerate(vectors) if vector is None]
+                if missing:
+                    for i, vector in zip(missing, self._embed_batch_task([texts[i] for i in missing])):
+                        vectors[i] = vector
+                return np.vstack(vectors), time.time() - batch_start, len(missing)
+
+            controller = self.embed_controller
+            with ThreadPoolExecutor(max_workers=controller.max_limit) as embed_pool:
+                def submit_embed(batch_chunks):
+                    """Submits a batch whose capacity slot is already reserved; the slot is freed when it finishes."""
+                    future = embed_pool.submit(timed_embed, [chunk['text'] for chunk in batch_chunks])
+                    future.add_done_callback(lambda _: controller.release())
+                    return future
+
+                def submit_embed_batch():
+                    nonlocal next_row
+                    batch_chunks = pending_chunks[:batch_tuner.batch_size]
+                    del pending_chunks[:len(batch_chunks)]
+                    embeds_in_flight.append([batch_chunks, submit_embed(batch_chunks), 1])
+                    next_row += len(batch_chunks)
+
+                def replay_committed_batch():
+                    """Queues chunks whose vectors are already in the file from before the restart."""
+                    nonlocal next_row
+                    batch_chunks = pending_chunks[:min(batch_tuner.batch_size, resume_rows - next_row)]
+                    del pending_chunks[:len(batch_chunks)]
+                    IngestCheckpoint.update_digest(replayed_digest, batch_chunks)
+                    next_row += len(batch_chunks)
+                    if next_row == resume_rows and replayed_digest.hexdigest() != resume_digest:
+                        raise CheckpointMismatch("The checkpoint does not match the document's chunks. Load the PDF again to start over.")
+                    stored = Future()
+                    stored.set_result((None, 0.0, 0))
+                    embeds_in_flight.append([batch_chunks, stored, 1])
+
+                print(f"  - Starting text extraction with {num_processes_parse} worker process(es)...")
+                parser = PageParseScheduler(pool, parse_args, window=num_processes_parse * PARSE_WINDOW_PER_WORKER,
+                                            known_results=known_results, keep_open=self._ingesting_paths)
+
+                while not parser.done or pending_chunks or embeds_in_flight:
+                    if cancel_event.is_set() or self.shutting_down:
+                        raise IngestCancelled()
+                    # Completed batches are written strictly in order, so rows always match chunks.
+                    if embeds_in_flight and embeds_in_flight[0][1].done():
+                        batch_chunks, future, attempts = embeds_in_flight[0]
+                        try:
+                            vectors, elapsed, requested = future.result()
+                        except Exception as e:
+                            controller.on_error(is_timeout=isinstance(e, httpx.TimeoutException))
+                            batch_tuner.on_error()
+                            if attempts >= EMBED_MAX_ATTEMPTS:
+                                raise ValueError(f"Embedding chunks {embedded_count + 1}-{embedded_count + len(batch_chunks)} failed. Error: {e}")
+                            print(f"  - Batch of {len(batch_chunks)} failed ({e}). Retrying (attempt {attempts + 1}/{EMBED_MAX_ATTEMPTS}).")
+                            controller.acquire()
+                            embeds_in_flight[0] = [batch_chunks, submit_embed(batch_chunks), attempts + 1]
+                            continue
+                        # Batches served from the previous version say nothing about the server's speed.
+                        if requested:
+                            controller.on_success(requested, elapsed)
+                        if requested == len(batch_chunks):
+                            batch_tuner.on_success(requested, elapsed)
+
+                        embeds_in_flight.popleft()
+                        writer.put(vectors, batch_chunks)
+                        embedded_count += len(batch_chunks)
+                        print(f"  - '{pdf_id}': pages parsed: {parsed_pages}/{page_count}, chunks embedded: {embedded_count} ({controller.describe()})")
+                        self._set_ingest_progress(pdf_id, f"Parsed {parsed_pages}/{page_count} | Embedded {embedded_count}")
+                        continue
+
+                    batch_ready = len(pending_chunks) >= batch_tuner.batch_size or (pending_chunks and parser.done)
+                    if pending_chunks and next_row < resume_rows:
+                        replay_committed_batch()
+                    elif batch_ready and controller.try_acquire():
+                        submit_embed_batch()
+                    elif not parser.done and (controller.has_capacity() or len(pending_chunks) < batch_tuner.batch_size):
+                        ready_units = parser.get(timeout=PARSE_POLL_INTERVAL)
+                        if ready_units is None:
+                            continue # Nothing parsed yet; check for a cancel before waiting again
+                        parsed_pages = parser.pages_done
+                        for unit in ready_units:
+                            page_units.setdefault(unit["page"], []).append([unit["text"], unit["tokens"], unit["block_end"]])
+                        pending_chunks.extend(clean_and_pack(ready_units, is_last=parser.done))
+                        self._set_ingest_progress(pdf_id, f"Parsed {parsed_pages}/{page_count} | Embedded {embedded_count}")
+                        if parsed_pages % 25 == 0 or parser.done:
+                            print(f"  - Pages parsed: {parsed_pages}/{page_count}")
+                        if first_chunk_time is None and pending_chunks:
+                            first_chunk_time = time.time() - ingest_start
+                            print(f"  - First chunk ready {first_chunk_time:.2f}s after the ingest started.")
+                    elif embeds_in_flight:
+                        wait([embeds_in_flight[0][1]], timeout=1.0)
+                    else:
+                        controller.wait_for_capacity(timeout=0.5) # Other documents hold every slot
 
-            # --- Stage 3: Vector Saving ---
-            print(f"[Stage 3/3] Saving {len(results)} vectors to disk...")
-            self.after(0, lambda: self.status_label.config(text=f"Saving 0/{total_chunks}", foreground=Style.ACCENT))
-            
-            if not results:
-                raise ValueError("Embedding process returned no results.")
-
-            first_vector = results[0]
-            mmap_shape = (total_chunks, len(first_vector))
-            mmap_path = os.path.join(self.vector_cache_dir, f"{pdf_id}.mmap")
-            mmap_vectors = np.memmap(mmap_path, dtype=np.float16, mode='w+', shape=mmap_shape)
-            print(f"  - Created memory-mapped file at '{mmap_path}' with shape {mmap_shape}.")
-
-            for i, vector in enumerate(results):
-                mmap_vectors[i] = vector
-                if (i + 1) % 50 == 0 or (i + 1) == total_chunks:
-                     print(f"  - Serialized vector {i+1}/{total_chunks}")
-                     self.after(0, lambda p=i+1: self.status_label.config(text=f"Saving: {p}/{total_chunks}"))
-            
-            mmap_vectors.flush()
-            print("  - Flushed all vectors to disk.")
+            writer.close()
+            if writer.rows_written == 0:
+                raise ValueError("Could not extract any text from PDF.")
+            if writer.rows_written < resume_rows:
+                raise CheckpointMismatch("The checkpoint does not match the document's chunks. Load the PDF again to start over.")
+            writer.commit(self._get_vector_path(pdf_id))
+
+            if boilerplate is not None:
+                print(f"  - Dropped {boilerplate.dropped_units} boilerplate lines ({boilerplate.dropped_chars} chars).")
+            if deduplicator is not None:
+                print(f"  - Dedup: dropped {deduplicator.duplicates} duplicate chunks ({deduplicator.duplicate_chars} chars).")
+
+            print(f"  - {self.embedding_cache.describe()}")
+            if previous is not None:
+                print(f"  - Reused {previous.reused_rows}/{writer.rows_written} vectors from the earlier version.")
+
+            elapsed = time.time() - start_time
+            print(f"  - Ingest pipeline complete: {writer.rows_written} chunks in {elapsed:.1f}s "
+                  f"({writer.rows_written / max(elapsed, 1e-6):.1f} chunks/sec, final batch size {batch_tuner.batch_size}, "
+                  f"final concurrency {controller.limit}).")
+
+            storage = self._quantize_index(pdf_id, writer.dim)
+            self._build_lexical_index(pdf_id)
+            # Written last: the chunk table marks the index as complete.
+            saved_units = reference_page_units(page_units, chunk_table)
+            pages = [{"fingerprint": fingerprint, "units": saved_units.get(n + 1, [])} for n, fingerprint in enumerate(page_fingerprints)]
+            self._save_persisted_index(pdf_id, pdf_path, writer.dim, pages, storage)
+            checkpoint.remove()
+            if previous is not None and previous.reused_pages:
+                self._discard_previous_version(previous)
 
             print(f"--- Successfully processed and embedded '{pdf_id}' ---")
-            self.after(0, lambda: self.append_to_chat(f"Ready to chat with '{pdf_id}'.\n\n", "thinking_tag"))
+            self._on_ingest_succeeded(pdf_id, interactive)
 
         except Exception as e:
-            print(f"--- Error processing PDF '{pdf_id}': {e} ---", file=sys.stderr)
-            self.after(0, lambda: messagebox.showerror("Processing Error", f"Failed to process '{pdf_id}'.\n\nDetails: {e}"))
-            self.remove_document_data(pdf_id)
+            if writer is not None and writer.is_alive():
+                try: writer.close() # Flush what was embedded and release the vector file
+                except Exception: pass
+            keep_work = self._keep_ingest_checkpoint(pdf_id, checkpoint, writer, resume_rows, e)
+            if self.shutting_down:
+                return
+            if isinstance(e, IngestCancelled):
+                print(f"--- Cancelled processing of '{pdf_id}' ({checkpoint.rows if keep_work else 0} rows kept) ---")
+                self.after(0, lambda: self.remove_document_data(pdf_id, keep_index=keep_work))
+            else:
+                self._on_ingest_failed(pdf_id, e, interactive, keep_index=keep_work)
         finally:
-            self.after(0, lambda: self.load_pdf_button.config(state=tk.NORMAL))
-            self.after(0, lambda: self.status_label.config(text="Idle."))
-
-    def remove_document_data(self, doc_id):
+            if previous is not None: previous.close()
+
+    def _keep_ingest_checkpoint(self, pdf_id, checkpoint, writer, resume_rows, error):
+        """Saves the final checkpoint of an ingest that stopped early. Returns True if there is work to resume."""
+        if isinstance(error, CheckpointMismatch):
+            if checkpoint is not None: checkpoint.remove()
+            return False
+        if checkpoint is None or writer is None or writer.rows_written < resume_rows:
+            # Stopped before the committed rows were replayed: the checkpoint on disk still holds.
+            return os.path.exists(self._get_checkpoint_path(pdf_id))
+        try:
+            if writer.rows_written == 0 or writer.error:
+                checkpoint.remove()
+                return False
+            checkpoint.save(writer, cancelled=isinstance(error, IngestCancelled) and not self.shutting_down)
+            print(f"  - Checkpoint saved: {checkpoint.rows} rows can be reused when '{checkpoint.info['source_name']}' is loaded again.")
+            return True
+        except OSError as e:
+            print(f"  - Could not save the ingest checkpoint: {e}")
+            return False
+
+    def _discard_previous_version(self, previous):
+        """Deletes an earlier version's index once the new one is saved, unless a loaded document still uses it."""
+        previous.close()
+        with self.ingest_lock:
+            in_use = previous.key in list(self.doc_index_keys.values()) or previous.key in self.ingest_active_keys
+        if not in_use:
+            self._remove_index_files(previous.key, "earlier version")
+
+    def remove_document_data(self, doc_id, keep_index=False):
+        """Removes a document from the app. With keep_index, its files stay on disk so a later load can resume."""
         if doc_id in self.pdf_text_db: del self.pdf_text_db[doc_id]
         if doc_id in self.chat_sessions:
             del self.chat_sessions[doc_id]
+            self.history_manager.forget(doc_id)
             try:
                 idx = list(self.chat_list_box.get(0, tk.END)).index(doc_id)
                 self.chat_list_box.delete(idx)
@@ -1039,7 +3733,13 @@ class ResearchApp(tk.Tk):
             idx = list(self.doc_list_box.get(0, tk.END)).index(doc_id)
             self.doc_list_box.delete(idx)
         except ValueError: pass
-        self.remove_vector_cache(doc_id)
+        key = self.doc_index_keys.get(doc_id)
+        shared = any(other != doc_id and other_key == key for other, other_key in list(self.doc_index_keys.items()))
+        if not keep_index and not shared: self.remove_vector_cache(doc_id) # Identical files loaded under two names share one index
+        self.doc_index_keys.pop(doc_id, None)
+        self.doc_paths.pop(doc_id, None)
+        self.ivf_lists.pop(doc_id, None)
+        self.lexical_indexes.pop(doc_id, None)
         if self.current_chat_id == doc_id: self.start_new_chat()
 
     def remove_selected_pdf(self):
@@ -1047,9 +3747,17 @@ class ResearchApp(tk.Tk):
         if not selected_indices: return
         pdf_to_remove = self.doc_list_box.get(selected_indices[0])
         if messagebox.askyesno("Confirm Removal", f"Delete '{pdf_to_remove}'?"):
+            with self.ingest_lock:
+                job = self.ingest_jobs.get(pdf_to_remove)
+                if job is not None and not job["started"]:
+                    del self.ingest_jobs[pdf_to_remove] # Still queued: the worker will skip it
+            if job is not None and job["started"]:
+                return messagebox.showwarning("Busy", f"'{pdf_to_remove}' is being processed and cannot be removed until it finishes.")
             self.remove_document_data(pdf_to_remove)
+            if job is not None: self._report_bulk_ingest()
             if pdf_to_remove in self.chat_sessions:
                 del self.chat_sessions[pdf_to_remove]
+                self.history_manager.forget(pdf_to_remove)
                 try:
                     idx = list(self.chat_list_box.get(0, tk.END)).index(pdf_to_remove)
                     self.chat_list_box.delete(idx)
@@ -1061,6 +3769,7 @@ class ResearchApp(tk.Tk):
         chat_to_remove = self.chat_list_box.get(selected_indices[0])
         if messagebox.askyesno("Confirm Removal", f"Delete chat '{chat_to_remove}'?"):
             del self.chat_sessions[chat_to_remove]
+            self.history_manager.forget(chat_to_remove)
             self.chat_list_box.delete(selected_indices[0])
             if self.current_chat_id == chat_to_remove: self.start_new_chat()
 
@@ -1077,10 +3786,6 @@ class ResearchApp(tk.Tk):
             self.chat_list_box.selection_clear(0, tk.END)
 
         selected_id = source_listbox.get(selected_indices[0])
-        if self.processing_thread and self.processing_thread.is_alive():
-            messagebox.showwarning("Busy", "Cannot switch items while processing.")
-            return
-
         self.current_chat_id = selected_id
         self.current_chat_label.config(text=self.current_chat_id)
         self.load_chat_history(self.current_chat_id)
@@ -1089,7 +3794,9 @@ class ResearchApp(tk.Tk):
         self.chat_box.config(state=tk.NORMAL); self.chat_box.delete(1.0, tk.END)
         message_history = self.chat_sessions.get(session_id, [])
         
-        if session_id in self.pdf_text_db and not os.path.exists(os.path.join(self.vector_cache_dir, f"{session_id}.mmap")):
+        if self._is_ingesting(session_id):
+            self.append_to_chat(f"'{session_id}' is still being processed. Questions will only use the pages embedded so far.\n\n", "thinking_tag")
+        if session_id in self.pdf_text_db and not self._is_ingesting(session_id) and not self._has_index_vectors(session_id):
             self.append_to_chat(f"Data for '{session_id}' is not loaded. Please reload the PDF.", "error_tag")
         else:
             model_name = self.model_var.get().split(':')[0].capitalize() if self.model_var.get() else "AI"
@@ -1125,14 +3832,201 @@ class ResearchApp(tk.Tk):
         if file_path:
             with open(file_path, "w", encoding="utf-8") as f: f.write(content)
             
-    def remove_vector_cache(self, pdf_id):
-        mmap_path = os.path.join(self.vector_cache_dir, f"{pdf_id}.mmap")
-        if os.path.exists(mmap_path):
+    def _get_index_key(self, file_hash):
+        """Derives the persistent index key from the file content, embedding model and chunking parameters."""
+        signature = f"v{INDEX_FORMAT_VERSION}|{file_hash}|{self.embedding_model_name}|{self._get_chunking_signature()}"
+        return hashlib.sha256(signature.encode("utf-8")).hexdigest()[:32]
+
+    def _get_chunking_signature(self):
+        # "+dedup" stands for both filters, as it did before they could be switched separately.
+        filters = {(True, True): "+dedup", (True, False): "+boilerplate", (False, True): "+unique"}
+        return self.chunker.signature() + filters.get((self.remove_boilerplate, self.deduplicate_chunks), "")
+
+    def _get_index_file(self, key, extension):
+        return os.path.join(self.vector_cache_dir, f"{key}{extension}")
+
+    def _get_vector_path(self, doc_id):
+        return self._get_index_file(self.doc_index_keys.get(doc_id, doc_id), ".vec")
+
+    def _get_partial_vector_path(self, doc_id):
+        return self._get_index_file(self.doc_index_keys.get(doc_id, doc_id), ".vec.partial")
+
+    def _vector_header_fields(self):
+        """VectorIndexFile header fields that must match the current settings for a vector file to be usable."""
+        return {"embedding_model": self.embedding_model_name, "chunker": self._get_chunking_signature(), "normalized": True}
+
+    def _get_chunks_path(self, doc_id):
+        return self._get_index_file(self.doc_index_keys.get(doc_id, doc_id), ".chunks.json")
+
+    def _get_pages_path(self, doc_id):
+        return self._get_index_file(self.doc_index_keys.get(doc_id, doc_id), ".pages.json")
+
+    def _get_checkpoint_path(self, doc_id):
+        return self._get_index_file(self.doc_index_keys.get(doc_id, doc_id), ".ckpt.json")
+
+    def _find_checkpoint(self, doc_id):
+        """Returns (rows, dim, digest) of an interrupted ingest of this document, or (0, None, None) to start fresh."""
+        data = IngestCheckpoint.load(self._get_checkpoint_path(doc_id))
+        partial_path = self._get_partial_vector_path(doc_id)
+        if not data or not data.get("rows") or not os.path.exists(partial_path):
+            return 0, None, None
+        if (data.get("version") != INDEX_FORMAT_VERSION or data.get("embedding_model") != self.embedding_model_name
+                or data.get("chunker") != self._get_chunking_signature()):
+            print(f"  - Ignoring checkpoint for '{doc_id}': it was written with different settings.")
+            return 0, None, None
+        try:
+            vectors = VectorIndexFile.open(partial_path, dict(self._vector_header_fields(), dim=data["dim"]))
+        except (OSError, VectorIndexError) as e:
+            print(f"  - Ignoring checkpoint for '{doc_id}': {e}")
+            return 0, None, None
+        if len(vectors) < data["rows"]:
+            print(f"  - Ignoring checkpoint for '{doc_id}': the vector file is shorter than the checkpoint.")
+            return 0, None, None
+        if data.get("checksum") is None or VectorIndexFile.data_checksum(partial_path, vectors[:data["rows"]].nbytes) != data["checksum"]:
+            print(f"  - Ignoring checkpoint for '{doc_id}': the vector file's rows do not match the checkpoint.")
+            return 0, None, None
+        return data["rows"], data["dim"], data["digest"]
+
+    def _save_persisted_index(self, doc_id, pdf_path, dim, pages, storage="float16"):
+        """Writes the chunk table next to the vector file so the document can be reopened without re-embedding.
+
+        `pages` holds each page's fingerprint and its parsed text units as
+        references into the chunk table, which let a later, edited version of
+        the document skip its unchanged pages.
+        """
+        index_data = {
+            "version": INDEX_FORMAT_VERSION,
+            "source_name": os.path.basename(pdf_path),
+            "embedding_model": self.embedding_model_name,
+            "chunker": self._get_chunking_signature(),
+            "dim": dim,
+            "storage": storage,
+            "chunks": self.pdf_text_db[doc_id].to_records(),
+        }
+        # Write to a temp file and rename, so a crash never leaves a half-written table behind.
+        # The chunk table goes last: it marks the index as complete.
+        for path, data in ((self._get_pages_path(doc_id), {"version": INDEX_FORMAT_VERSION, "pages": pages}),
+                           (self._get_chunks_path(doc_id), index_data)):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        print(f"  - Saved chunk table to '{self._get_chunks_path(doc_id)}'.")
+        self._record_document_version(doc_id)
+
+    def _read_persisted_index(self, key):
+        """Reads and validates the chunk table stored under `key`. Returns None if it is missing, stale or incomplete.
+
+        Vector files are checked by header and size only, so a cached document opens
+        without reading its vectors; `verify_index_checksums` also checks their CRC-32.
+        """
+        chunks_path = self._get_index_file(key, ".chunks.json")
+        vector_path = self._get_index_file(key, ".vec")
+        if not os.path.exists(chunks_path):
+            return None
+
+        try:
+            with open(chunks_path, "r", encoding="utf-8") as f:
+                index_data = json.load(f)
+            chunks, dim = index_data["chunks"], index_data["dim"]
+            if (index_data.get("version") != INDEX_FORMAT_VERSION or index_data.get("embedding_model") != self.embedding_model_name
+                    or index_data.get("chunker") != self._get_chunking_signature()):
+                print(f"  - Index '{key}' was built with different settings.")
+                return None
+            expected = dict(self._vector_header_fields(), complete=True, rows=len(chunks), dim=dim)
+            quantized = index_data.get("storage", "float16") in QuantizedVectors.KINDS
+            if quantized:
+                vectors = QuantizedVectors.open(self._get_index_file(key, ".codes.npy"), self._get_index_file(key, ".codec.npz"))
+                VectorIndexFile.check(vectors.info, expected)
+                if vectors.codes.shape[0] != len(chunks) or vectors.dim != dim:
+                    print(f"  - Index '{key}' is incomplete ({vectors.codes.shape[0]} of {len(chunks)} {vectors.kind} rows).")
+                    return None
+            if not quantized or os.path.exists(vector_path): # Quantized indexes keep it only with keep_exact_vectors
+                header = VectorIndexFile.read_header(vector_path)
+                VectorIndexFile.check(header, expected)
+                VectorIndexFile.open(vector_path)
+                if self.app_config.get("verify_index_checksums", False):
+                    VectorIndexFile.verify(vector_path)
+                if quantized and vectors.info.get("checksum") != header["checksum"]:
+                    raise VectorIndexError(f"'{os.path.basename(vector_path)}' does not hold the vectors its codes were made from")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"  - Could not read index '{key}': {e}.")
+            return None
+        return index_data
+
+    def _load_persisted_index(self, doc_id):
+        """Restores a document's chunk table from disk. Returns True if a complete, matching index exists."""
+        index_data = self._read_persisted_index(self.doc_index_keys.get(doc_id, doc_id))
+        if index_data is None:
+            return False
+
+        self.pdf_text_db[doc_id] = ChunkTable.from_records(index_data["chunks"])
+        try:
+            lexical_index = LexicalIndex.load(self._get_index_file(self.doc_index_keys.get(doc_id, doc_id), ".bm25.npz"))
+            if len(lexical_index) != len(self.pdf_text_db[doc_id]):
+                raise ValueError("row count does not match the chunk table")
+            self.lexical_indexes[doc_id] = lexical_index
+        except (OSError, ValueError, KeyError):
+            self._build_lexical_index(doc_id) # Indexes saved before keyword search existed
+        self._record_document_version(doc_id)
+        print(f"  - Loaded persisted index for '{doc_id}': {len(index_data['chunks'])} chunks, {index_data['dim']} dims.")
+        return True
+
+    def _record_document_version(self, doc_id):
+        """Remembers the index last used for a document name in documents.json, the base for incremental reloads."""
+        manifest_path = os.path.join(self.vector_cache_dir, "documents.json")
+        with self.ingest_lock:
             try:
-                os.remove(mmap_path)
-                print(f"Removed vector cache for {pdf_id}: {mmap_path}")
-            except Exception as e:
-                print(f"Error removing vector cache for {pdf_id}: {e}")
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = {}
+            manifest[doc_id] = self.doc_index_keys[doc_id]
+            tmp_path = manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_path, manifest_path)
+
+    def _find_previous_version(self, doc_id):
+        """Opens the index of an earlier version of this document, if one was built with the current settings."""
+        try:
+            with open(os.path.join(self.vector_cache_dir, "documents.json"), "r", encoding="utf-8") as f:
+                previous_key = json.load(f).get(doc_id)
+        except (OSError, ValueError):
+            return None
+        if not previous_key or previous_key == self.doc_index_keys.get(doc_id):
+            return None
+
+        index_data = self._read_persisted_index(previous_key)
+        if index_data is None:
+            return None
+        try:
+            with open(self._get_index_file(previous_key, ".pages.json"), "r", encoding="utf-8") as f:
+                pages = json.load(f)["pages"]
+            vectors = None # Quantized rows are not reused: the chunks are embedded again, mostly from the embedding cache
+            if os.path.exists(self._get_index_file(previous_key, ".vec")):
+                vectors = VectorIndexFile.open(self._get_index_file(previous_key, ".vec"))
+            return PreviousIndexVersion(previous_key, pages, index_data["chunks"], vectors)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"  - Could not read page table of index '{previous_key}': {e}.")
+            return None
+
+    def _remove_index_files(self, key, label):
+        self.index_handles.invalidate(key) # Unmaps the files first; Windows cannot delete a mapped file
+        with self.section_notes_lock:
+            self.section_notes.pop(key, None)
+        for extension in (".vec", ".vec.partial", ".codes.npy", ".codec.npz", ".bm25.npz", ".chunks.json", ".pages.json", ".ckpt.json", ".ivf.npz",
+                          ".notes.json"):
+            cache_path = self._get_index_file(key, extension)
+            if os.path.exists(cache_path):
+                try:
+                    os.remove(cache_path)
+                    print(f"Removed vector cache for {label}: {cache_path}")
+                except Exception as e:
+                    print(f"Error removing vector cache for {label}: {e}")
+
+    def remove_vector_cache(self, pdf_id):
+        self._remove_index_files(self.doc_index_keys.get(pdf_id, pdf_id), pdf_id)
 
     def open_settings_window(self):
         settings_dialog = SettingsWindow(self, self.app_config, self._save_and_update_config)
@@ -1263,7 +4157,7 @@ class ResearchApp(tk.Tk):
             messagebox.showerror("Ollama Not Found", "Ollama executable not found. Please configure the path to ollama.exe in settings.")
             self.status_light.config(foreground=Style.ERROR); self.status_label.config(text="Ollama Not Found")
             self.model_selector['values'] = ["Connection Failed"]; self.model_var.set("Connection Failed")
-            self.load_pdf_button.config(state=tk.DISABLED)
+            self.load_pdf_button.config(state=tk.DISABLED); self.load_folder_button.config(state=tk.DISABLED)
             return
 
         print(f"1. Executable path: {ollama_path}")
@@ -1348,7 +4242,46 @@ class ResearchApp(tk.Tk):
             # located within this single 'model_folder' directory.
             "model_folder": os.path.join("Portable_AI_Assets", "models"),
             "vector_cache_dir": os.path.join("Portable_AI_Assets", "vector_cache"),
-            "embedding_model_name": "all-minilm"
+            "embedding_model_name": "all-minilm",
+            # Chunks per embedding request. 0 lets the app tune it at ingest time.
+            "embedding_batch_size": 0,
+            # Upper bound for concurrent embedding requests. 0 uses the CPU count.
+            "embedding_max_concurrency": 0,
+            # "structured" packs sentences and paragraphs to a token budget; "fixed" is the old 500-character slicing.
+            "chunker": "structured",
+            "chunk_tokens": CHUNK_TOKENS,
+            "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+            # Drop repeated headers/footers/page numbers.
+            "remove_boilerplate": True,
+            # Embed identical chunks only once; answers cite every page the text appears on.
+            "deduplicate_chunks": True,
+            # Size cap of the on-disk embedding cache shared by all documents and queries. 0 disables it.
+            "embedding_cache_max_mb": 256,
+            # Documents ingested at the same time from a folder or multi-file selection.
+            "ingest_parallel_documents": 2,
+            # Loaded chunks at which searches switch to the approximate (IVF) index. 0 always searches exhaustively.
+            "ann_min_chunks": 50000,
+            # IVF lists probed per query. Higher is slower but closer to exhaustive search.
+            "ann_nprobe": 16,
+            # On-disk vector format: "float16", "int8" (about 2x smaller) or "pq" (about 8x smaller, for large documents).
+            "vector_storage": "float16",
+            # Keep the float16 file next to int8/pq codes, so results are always re-ranked exactly (uses more disk).
+            "keep_exact_vectors": False,
+            # Read every vector file and check its CRC-32 when a document is loaded from the cache (slow for large indexes).
+            "verify_index_checksums": False,
+            # Combine keyword (BM25) and vector search, so exact terms like formulas and sample IDs are found.
+            "hybrid_search": True,
+            # Address space kept mapped for recently searched vector files, so follow-up questions skip reopening them.
+            "index_cache_max_mb": 1024,
+            # Context window (tokens) of every chat model request. Longer documents are summarized section by section.
+            "context_tokens": 8192,
+            # How long Ollama keeps the chat model loaded after a request (e.g. "30m", "2h", or -1 for always).
+            "keep_alive": "30m",
+            # Tokens of earlier conversation sent with each chat turn, per chat model ("default" for the rest).
+            # Older turns are folded into a summary of the chat in the background.
+            "history_token_budget": {"default": 2048},
+            # Section notes requested from Ollama at the same time while summarizing or reviewing a long document.
+            "summary_parallel_requests": 2
         }
         print(f"3. Default config loaded: {json.dumps(default_config, indent=2)}")
 
@@ -1484,6 +4417,63 @@ class ConsoleRedirector:
         pass
 
 
+class PanelReviewWindow(tk.Toplevel):
+    """Lets the user pick the expert reviewers of a panel review, then shows each review in its own tab.
+
+    Tabs are filled from worker threads through the app's after() calls; once
+    the window is closed the remaining text is dropped, and the reviews still
+    reach the Chief Editor.
+    """
+    def __init__(self, master, doc_id, roles, start_callback):
+        super().__init__(master)
+        self.title(f"Panel Review - {doc_id}")
+        self.geometry("900x650")
+        self.configure(bg=Style.BG_PRIMARY)
+        self.transient(master)
+        self.start_callback = start_callback
+        self.role_vars = {role: tk.BooleanVar(value=True) for role in roles}
+        self.panes, self.tab_ids = {}, {}
+
+        self.setup_frame = ttk.Frame(self, style='TFrame')
+        self.setup_frame.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Label(self.setup_frame, text="Reviewers:", style='TLabel').pack(side=tk.LEFT, padx=(0, 10))
+        for role, var in self.role_vars.items():
+            ttk.Checkbutton(self.setup_frame, text=role, variable=var, style='Tool.TCheckbutton').pack(side=tk.LEFT, padx=5)
+        self.start_button = ttk.Button(self.setup_frame, text="Start Review", command=self.start, style='Accent.Sidebar.TButton')
+        self.start_button.pack(side=tk.RIGHT)
+
+        self.notebook = ttk.Notebook(self)
+        self.notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        self.status_label = ttk.Label(self, text="Select the reviewers and press Start Review.", style='TLabel', foreground=Style.FG_SECONDARY)
+        self.status_label.pack(fill=tk.X, padx=10, pady=(0, 10))
+
+    def start(self):
+        roles = [role for role, var in self.role_vars.items() if var.get()]
+        if not roles:
+            return messagebox.showinfo("No Reviewers", "Please select at least one reviewer.", parent=self)
+        for child in self.setup_frame.winfo_children():
+            if isinstance(child, (ttk.Checkbutton, ttk.Button)):
+                child.state(['disabled'])
+        for role in roles:
+            pane = scrolledtext.ScrolledText(self.notebook, wrap=tk.WORD, state=tk.DISABLED, bg=Style.BG_PRIMARY, fg=Style.FG_PRIMARY, font=Style.CHAT_FONT,
+                                             relief=tk.FLAT, borderwidth=0, highlightthickness=0, padx=10, pady=10)
+            self.notebook.add(pane, text=f"{role} (waiting)")
+            self.panes[role], self.tab_ids[role] = pane, self.notebook.tabs()[-1]
+        self.start_callback(roles)
+
+    def append(self, role, text):
+        if not self.winfo_exists(): return
+        pane = self.panes[role]
+        pane.config(state=tk.NORMAL); pane.insert(tk.END, text); pane.config(state=tk.DISABLED); pane.see(tk.END)
+
+    def set_role_status(self, role, status):
+        if not self.winfo_exists(): return
+        self.notebook.tab(self.tab_ids[role], text=f"{role} ({status})")
+
+    def set_status(self, text):
+        if not self.winfo_exists(): return
+        self.status_label.config(text=text)
+
 class SettingsWindow(tk.Toplevel):
 
 
@@ -1679,7 +4669,9 @@ class SettingsWindow(tk.Toplevel):
     def save_settings(self):
 
 
-        new_config = {
+        # Start from the current config so settings without a field here are kept.
+        new_config = dict(self.current_config)
+        new_config.update({
 
 
             "ollama_path": self.ollama_path_entry.get(),
@@ -1694,7 +4686,7 @@ class SettingsWindow(tk.Toplevel):
             "embedding_model_name": self.embed_model_entry.get()
 
 
-        }
+        })
 
 
         self.save_callback(new_config)